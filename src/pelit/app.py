@@ -1,20 +1,31 @@
 import sys
+import json
+from pathlib import Path
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from pelit.plib.result import Err
-from pelit.plib.arg import parse_arguments, parse_envvars
+from pelit.plib.arg import VERBS, parse_arguments, parse_envvars
 from pelit.plib.log import p_logger
 from pelit.plib.config import parse_config
+from pelit.plib.storage import create_storage
+from pelit.plib.scrub import scrub
+from pelit.plib.restore import restore_from_file, try_lock
+from pelit.plib.route_tool import is_attempting_traversal
+from pelit.plib.replicate import p_replicator
 from pelit.route import create_route
 
 # 准备配置文件
 def create_app() -> Flask:
-    # 处理参数
-    cmd = parse_envvars()
-    if isinstance(cmd, Err):
+    # 处理参数：给出动词时以命令行为准，否则（如由 Gunicorn 导入时）优先读取环境变量
+    if len(sys.argv) > 1 and sys.argv[1] in VERBS:
         cmd = parse_arguments(sys.argv)
+    else:
+        cmd = parse_envvars()
         if isinstance(cmd, Err):
-            print(cmd)
-            exit(1)
+            cmd = parse_arguments(sys.argv)
+    if isinstance(cmd, Err):
+        print(cmd)
+        exit(1)
     cmd = cmd.value
 
     # 创建日志组件
@@ -32,6 +43,54 @@ def create_app() -> Flask:
         lg.info("配置文件有效")
         exit(0)
 
+    # 校验所有文件，输出报告后退出
+    if cmd['scrub']:
+        storage = create_storage(cfg['storage'])
+        state = Path(cfg['storage']['path']) / '.pelit-scrub.json'
+        report = scrub(storage, state, lg, cmd['jobs'], cmd['bandwidth'])
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if cmd['report_path']:
+            with open(cmd['report_path'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            print(output)
+        problems = len(report['missing']) + len(report['corrupt']) + len(report['unreadable'])
+        lg.info(f"检查了 {report['checked']} 个文件，发现 {problems} 个问题")
+        exit(2 if problems else 0)
+
+    # 从备份归档恢复后退出
+    if cmd['restore']:
+        if is_attempting_traversal(cmd['directory']):
+            lg.error(f"无效的目录: {cmd['directory']}")
+            exit(1)
+        storage = create_storage(cfg['storage'])
+        # 与 POST /restore 共用锁，锁在进程退出时释放
+        if try_lock(Path(cfg['storage']['path']) / '.pelit-restore.lock') is None:
+            lg.error("已有恢复任务正在进行")
+            exit(1)
+
+        def progress(read: int, total: int, files: int):
+            sys.stderr.write(f"\r{read * 100 // max(total, 1)}% {files} 个文件")
+            sys.stderr.flush()
+
+        result = restore_from_file(storage, Path(cmd['archive_path']), cmd['directory'],
+                                   cmd['jobs'] or 8, progress)
+        sys.stderr.write('\n')
+        if isinstance(result, Err):
+            lg.error(str(result))
+            exit(1)
+        lg.info(f"恢复成功：{result.value['files']} 个文件，"
+                f"目录 {', '.join(result.value['directories'])}")
+        if result.value['previous']:
+            lg.warn(f"被替换的目录保留在 {', '.join(result.value['previous'])}，"
+                    f"其中可能有备份之后上传的文件，确认后请手动删除")
+        # 由运行中的服务（或下次启动时）把恢复的目录同步到镜像
+        if 'replication' in cfg:
+            replicator = p_replicator(cfg['replication'], storage, cfg['storage']['path'], lg)
+            for d in result.value['directories']:
+                replicator.record('sync', d, '')
+        exit(0)
+
     # 导入 route.py 定义的路径
     route = create_route(cfg, lg)
 
@@ -39,4 +98,12 @@ def create_app() -> Flask:
     app = Flask(__name__)
     app.register_blueprint(route)
 
+    # 位于反向代理之后时，从 X-Forwarded-For 中取客户端 IP，否则所有客户端共用代理的 IP
+    proxy_hops = cfg.get('limit', {}).get('proxy_hops', 0)
+    if proxy_hops > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops)
+
     return app
+
+if __name__ == "__main__":
+    create_app().run()
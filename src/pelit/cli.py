@@ -0,0 +1,174 @@
+import os
+import re
+import sys
+import tempfile
+import urllib.request
+from typing import TypedDict
+from pathlib import Path
+from pelit.client import p_client
+from pelit.plib.result import Ok, Err, Result
+
+# 命令行参数格式
+class Client_params(TypedDict):
+    verb: str
+    args: list[str]
+    url: str
+    auth: str
+    jobs: int
+    retries: int
+    manifest: str | None
+
+USAGE = """用法:
+    pelit upload <本地文件、目录或 URL> <服务器目录> [选项]
+    pelit delete <服务器目录>/<文件名> [选项]
+    pelit list <服务器目录 或 /> [选项]
+
+选项:
+    -u, --url       API 地址，默认读取 PELIT_URL 环境变量
+    -a, --auth      认证密钥，默认读取 PELIT_AUTH 环境变量
+    -j, --jobs      上传目录时的并行数，默认为 8
+    -r, --retries   失败时的最大重试次数，默认为 3
+    -m, --manifest  上传目录时使用的清单，默认为目录下的 .pelit-manifest.json"""
+
+def parse_client_arguments(args: list[str]) -> Result[Client_params, str]:
+    """
+    读取客户端的命令行参数
+
+    Args:
+        args: 传入的命令行参数列表
+
+    Returns:
+        Result 类型的参数解析，若解析失败则返回 Err
+    """
+    cmd: Client_params = {
+        "verb": "",
+        "args": [],
+        "url": os.getenv('PELIT_URL', ''),
+        "auth": os.getenv('PELIT_AUTH', ''),
+        "jobs": 8,
+        "retries": 3,
+        "manifest": None
+    }
+
+    if len(args) < 2:
+        return Err("缺少参数")
+
+    # 第一个参数是动词
+    verb: str = args[1]
+    match verb:
+        case "upload":
+            count = 2
+        case "delete" | "list":
+            count = 1
+        case _:
+            return Err(f"未知动词: {verb}")
+    cmd["verb"] = verb
+
+    # 动词之后是位置参数
+    i = 2
+    while i < len(args) and len(cmd["args"]) < count:
+        cmd["args"].append(args[i])
+        i += 1
+    if len(cmd["args"]) < count:
+        return Err(f"{verb} 缺少参数")
+
+    # 处理传入值的选项
+    while i < len(args):
+        option: str = args[i]
+        if i + 1 > len(args) - 1:
+            return Err(f"参数 {option} 缺少值")
+        value: str = args[i + 1]
+
+        match option:
+            case "-u" | "--url":
+                cmd["url"] = value
+            case "-a" | "--auth":
+                cmd["auth"] = value
+            case "-j" | "--jobs" | "-r" | "--retries":
+                try:
+                    number = int(value)
+                except ValueError:
+                    return Err(f"参数 {option} 应为正整数")
+                if option in ("-j", "--jobs"):
+                    if number < 1:
+                        return Err(f"参数 {option} 应为正整数")
+                    cmd["jobs"] = number
+                else:
+                    if number < 0:
+                        return Err(f"参数 {option} 应为非负整数")
+                    cmd["retries"] = number
+            case "-m" | "--manifest":
+                cmd["manifest"] = value
+            case unknown_command:
+                return Err(f"未知选项: {unknown_command}")
+        i += 2
+
+    if not cmd["url"]:
+        return Err("必须指定 --url 或 PELIT_URL")
+    if not cmd["auth"]:
+        return Err("必须指定 --auth 或 PELIT_AUTH")
+
+    return Ok(cmd)
+
+def main():
+    cmd = parse_client_arguments(sys.argv)
+    if isinstance(cmd, Err):
+        print(cmd, file=sys.stderr)
+        print(USAGE, file=sys.stderr)
+        exit(1)
+    cmd = cmd.value
+
+    try:
+        client = p_client(cmd["url"].rstrip('/'), cmd["auth"], retries=cmd["retries"])
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        exit(1)
+
+    match cmd["verb"]:
+        case "upload":
+            source, directory = cmd["args"]
+            source_path = Path(source)
+
+            # 上传整个目录
+            if source_path.is_dir():
+                manifest = Path(cmd["manifest"]) if cmd["manifest"] else None
+                uploaded, failed = client.upload_dir(source_path, directory, cmd["jobs"],
+                                                     manifest, sys.stderr.isatty())
+                for name, url in uploaded.items():
+                    print(f"{name}\t{url}")
+                for name, error in failed.items():
+                    print(f"{name}: {error}", file=sys.stderr)
+                exit(1 if failed else 0)
+
+            # 远程文件先下载到临时目录
+            if re.match(r'^(http|https)://', source):
+                name = Path(source.split('?')[0]).name or 'file'
+                with tempfile.TemporaryDirectory(prefix='pelit_') as tmp:
+                    source_path = Path(tmp) / name
+                    try:
+                        urllib.request.urlretrieve(source, source_path)
+                    except Exception as e:
+                        print(f"下载失败: {e}", file=sys.stderr)
+                        exit(1)
+                    result = client.upload(source_path, directory)
+            else:
+                result = client.upload(source_path, directory)
+
+            if isinstance(result, Err):
+                print(result, file=sys.stderr)
+                exit(1)
+            print(result.value)
+
+        case "delete":
+            result = client.delete(cmd["args"][0])
+            if isinstance(result, Err):
+                print(result, file=sys.stderr)
+                exit(1)
+
+        case "list":
+            result = client.list(cmd["args"][0])
+            if isinstance(result, Err):
+                print(result, file=sys.stderr)
+                exit(1)
+            for name in result.value:
+                print(name)
@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import random
+import secrets
+import threading
+import http.client
+from typing import Any, Callable, Iterator
+from pathlib import Path
+from urllib.parse import urlsplit, quote
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pelit.plib.result import Ok, Err, Result
+
+# 值得重试的状态码：限速、网关错误和服务端错误
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# 非幂等请求（上传）只在服务器明确没有处理时重试：限速和暂不可用
+_RETRY_STATUS_UNSAFE = {429, 503}
+
+# 复用的长连接出现这些错误时，说明服务器已关闭空闲连接，请求没有被处理
+_STALE_ERRORS = (BrokenPipeError, ConnectionResetError, http.client.RemoteDisconnected)
+
+# 上传文件时每次读取的块大小
+_CHUNK = 1024 * 1024
+
+class p_client:
+    """
+    Pelit 的 Python 客户端，每个线程复用一个长连接，失败时指数退避重试
+
+    Attributes:
+        _scheme: [INTERNAL] http 或 https
+        _host: [INTERNAL] 服务器地址（含端口）
+        _prefix: [INTERNAL] API 地址的路径前缀
+        _auth: [INTERNAL] 认证密钥
+        _retries: [INTERNAL] 最大重试次数
+        _timeout: [INTERNAL] 单次请求超时（秒）
+        _local: [INTERNAL] 线程本地的连接
+    """
+    def __init__(self, url: str, auth: str, retries: int = 3, timeout: float = 60):
+        """
+        Args:
+            url: API 地址，例如 https://example.com
+            auth: 认证密钥
+            retries: 最大重试次数
+            timeout: 单次请求超时（秒）
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise ValueError(f"无效的地址: {url}")
+        self._scheme = parts.scheme
+        self._host = parts.netloc
+        self._prefix = parts.path.rstrip('/')
+        self._auth = auth
+        self._retries = retries
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        """
+        [INTERNAL] 获取当前线程的连接，不存在时创建
+        """
+        conn: http.client.HTTPConnection | None = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self._scheme == 'https':
+                conn = http.client.HTTPSConnection(self._host, timeout=self._timeout)
+            else:
+                conn = http.client.HTTPConnection(self._host, timeout=self._timeout)
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self):
+        """
+        [INTERNAL] 关闭当前线程的连接，下次请求时重新建立
+        """
+        conn: http.client.HTTPConnection | None = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _request(self,
+                 method: str,
+                 path: str,
+                 body: Callable[[], Iterator[bytes]] | None = None,
+                 headers: dict[str, str] | None = None,
+                 idempotent: bool = True) -> Result[tuple[int, dict[str, Any]], str]:
+        """
+        [INTERNAL] 发送请求并解析 JSON 响应，网络错误和可重试的状态码会退避重试
+
+        Args:
+            method: HTTP 方法
+            path: API 路径，如 /list
+            body: 每次重试时调用以生成请求体的函数
+            headers: 额外的请求头
+            idempotent: 为 False 时只重试 429、503 和发送前的连接错误，避免重复执行
+
+        Returns:
+            状态码和 JSON 响应，或报错信息
+        """
+        all_headers = {"Authorization": self._auth}
+        if headers:
+            all_headers.update(headers)
+
+        retry_status = _RETRY_STATUS if idempotent else _RETRY_STATUS_UNSAFE
+        error = ""
+        for attempt in range(self._retries + 1):
+            delay = 0.5 * 2 ** attempt * (0.5 + random.random())
+            sent = False
+            reused = False
+            try:
+                conn = self._connection()
+                reused = conn.sock is not None
+                if not reused:
+                    conn.connect()
+                sent = True
+                conn.request(method, self._prefix + path,
+                             body=body() if body else None, headers=all_headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                retry_after = resp.getheader('Retry-After')
+            except (OSError, http.client.HTTPException) as e:
+                self._drop_connection()
+                error = f"网络错误: {e}"
+                # 请求可能已经到达服务器，重试会重复执行；复用的连接已被关闭的情况除外
+                if sent and not idempotent and not (reused and isinstance(e, _STALE_ERRORS)):
+                    break
+                if attempt < self._retries:
+                    time.sleep(delay)
+                continue
+
+            if resp.status in retry_status and attempt < self._retries:
+                error = f"服务器返回 {resp.status}"
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+                # 等待期间服务器可能关闭空闲连接，重试时重新连接
+                self._drop_connection()
+                time.sleep(delay)
+                continue
+
+            try:
+                return Ok((resp.status, json.loads(data)))
+            except ValueError:
+                return Err(f"服务器返回 {resp.status}: 无效的响应")
+
+        return Err(error)
+
+    def upload(self, file: Path, directory: str) -> Result[str, str]:
+        """
+        上传一个本地文件
+
+        Args:
+            file: 本地文件路径
+            directory: 服务器上的保存目录
+
+        Returns:
+            文件的访问地址，或报错信息
+        """
+        boundary = secrets.token_hex(16)
+        filename = file.name.replace('"', '')
+        head = (f'--{boundary}\r\n'
+                f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+        tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        try:
+            size = file.stat().st_size
+        except OSError as e:
+            return Err(f"{file}: 读取错误: {e}")
+
+        def body() -> Iterator[bytes]:
+            yield head
+            with open(file, 'rb') as f:
+                while chunk := f.read(_CHUNK):
+                    yield chunk
+            yield tail
+
+        result = self._request('POST', f"/upload/{quote(directory, safe='')}", body, {
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(len(head) + size + len(tail)),
+        }, idempotent=False)
+        if isinstance(result, Err):
+            return result
+        status, resp = result.value
+        if status != 200:
+            return Err(f"{file}: {status} {resp.get('message', '')}")
+        return Ok(resp['url'])
+
+    def delete(self, path: str) -> Result[None, str]:
+        """
+        删除服务器上的文件
+
+        Args:
+            path: 服务器上的路径，格式为 directory/file
+
+        Returns:
+            成功时为 Ok(None)，否则为报错信息
+        """
+        result = self._request('DELETE', f"/delete/{quote(path.strip('/'))}")
+        if isinstance(result, Err):
+            return result
+        status, resp = result.value
+        if status != 200:
+            return Err(f"{path}: {status} {resp.get('message', '')}")
+        return Ok(None)
+
+    def list(self, directory: str = "") -> Result[list[str], str]:
+        """
+        列出服务器上的目录
+
+        Args:
+            directory: 服务器上的目录，空字符串表示根目录
+
+        Returns:
+            名称列表，或报错信息
+        """
+        directory = directory.strip('/')
+        path = f"/list/{quote(directory, safe='')}" if directory else "/list"
+        result = self._request('GET', path)
+        if isinstance(result, Err):
+            return result
+        status, resp = result.value
+        if status != 200:
+            return Err(f"{directory or '/'}: {status} {resp.get('message', '')}")
+        return Ok(resp['list'])
+
+    def upload_dir(self,
+                   local: Path,
+                   directory: str,
+                   jobs: int = 8,
+                   manifest: Path | None = None,
+                   progress: bool = True) -> tuple[dict[str, str], dict[str, str]]:
+        """
+        并行上传本地目录下的所有文件（递归，不含隐藏文件）
+
+        已上传的文件记录在清单中（默认为目录下的 .pelit-manifest.json），
+        大小和修改时间不变的文件会跳过
+
+        Args:
+            local: 本地目录
+            directory: 服务器上的保存目录
+            jobs: 并行上传数
+            manifest: 清单路径
+            progress: 是否向 stderr 输出进度
+
+        Returns:
+            本次上传成功的文件及其地址，和失败的文件及其报错信息
+        """
+        manifest = manifest or local / '.pelit-manifest.json'
+        records: dict[str, dict[str, Any]] = {}
+        if manifest.exists():
+            try:
+                records = json.loads(manifest.read_text('utf-8'))
+            except (OSError, ValueError):
+                records = {}
+
+        files: list[tuple[Path, str, os.stat_result]] = []
+        for file in sorted(local.rglob('*')):
+            rel = file.relative_to(local)
+            if any(part.startswith('.') for part in rel.parts) or not file.is_file():
+                continue
+            key = rel.as_posix()
+            st = file.stat()
+            record = records.get(key)
+            if record and record['directory'] == directory \
+                    and record['size'] == st.st_size and record['mtime_ns'] == st.st_mtime_ns:
+                continue
+            files.append((file, key, st))
+
+        uploaded: dict[str, str] = {}
+        failed: dict[str, str] = {}
+        done = 0
+
+        def save_manifest():
+            tmp = manifest.with_name(manifest.name + '.tmp')
+            tmp.write_text(json.dumps(records, ensure_ascii=False), 'utf-8')
+            os.replace(tmp, manifest)
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(self.upload, file, directory): (key, st)
+                       for file, key, st in files}
+            for future in as_completed(futures):
+                key, st = futures[future]
+                result = future.result()
+                done += 1
+                if isinstance(result, Err):
+                    failed[key] = str(result)
+                else:
+                    uploaded[key] = result.value
+                    records[key] = {
+                        "directory": directory,
+                        "size": st.st_size,
+                        "mtime_ns": st.st_mtime_ns,
+                        "url": result.value
+                    }
+                # 定期写入清单，中断后可以继续
+                if done % 100 == 0:
+                    save_manifest()
+                if progress:
+                    sys.stderr.write(f"\r{done}/{len(files)} 失败 {len(failed)}")
+                    sys.stderr.flush()
+
+        save_manifest()
+        if progress and files:
+            sys.stderr.write('\n')
+        return uploaded, failed
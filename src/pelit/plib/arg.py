@@ -2,12 +2,22 @@ import os
 from typing import TypedDict
 from pelit.plib.result import Ok, Err, Result
 
+# 命令行支持的动词
+VERBS = ("check", "run", "scrub", "restore")
+
 # 命令行参数格式
 class Commandline_params(TypedDict):
     check_only: bool
+    scrub: bool
+    restore: bool
     config_path: str
     verbosity: int
     log_path: str | None
+    jobs: int
+    bandwidth: float
+    report_path: str | None
+    archive_path: str | None
+    directory: str
 
 def parse_arguments(args: list[str]) -> Result[Commandline_params, str]:
     """
@@ -17,13 +27,20 @@ def parse_arguments(args: list[str]) -> Result[Commandline_params, str]:
         args: 传入的命令行参数列表
     
     Returns:
-        Result 类型的参数解析，若解析失败则返回 Err
+        Result 类型的参数解析，若解析失败则返回 Err；未指定 --config 时使用 PELIT_CONFIG
     """
     cmd: Commandline_params = {
         "check_only": False,
-        "config_path": "",
+        "scrub": False,
+        "restore": False,
+        "config_path": os.getenv('PELIT_CONFIG', ''),
         "verbosity": 1,
-        "log_path": None
+        "log_path": None,
+        "jobs": 0,
+        "bandwidth": 0,
+        "report_path": None,
+        "archive_path": None,
+        "directory": ""
     }
 
     if len(args) < 2:
@@ -35,6 +52,10 @@ def parse_arguments(args: list[str]) -> Result[Commandline_params, str]:
         cmd["check_only"] = True
     elif verb == "run":
         cmd["check_only"] = False
+    elif verb == "scrub":
+        cmd["scrub"] = True
+    elif verb == "restore":
+        cmd["restore"] = True
     else:
         return Err(f"未知动词: {verb}")
 
@@ -58,12 +79,35 @@ def parse_arguments(args: list[str]) -> Result[Commandline_params, str]:
                     return Err(f"无效的级别: {value}")
             case "-l" | "--log":
                 cmd["log_path"] = value
+            case "-j" | "--jobs":
+                try:
+                    cmd["jobs"] = int(value)
+                except ValueError:
+                    return Err(f"参数 {option} 应为正整数")
+                if cmd["jobs"] < 1:
+                    return Err(f"参数 {option} 应为正整数")
+            case "-b" | "--bandwidth":
+                try:
+                    cmd["bandwidth"] = float(value)
+                except ValueError:
+                    return Err(f"参数 {option} 应为数字")
+                if cmd["bandwidth"] < 0:
+                    return Err(f"参数 {option} 不能为负数")
+            case "-o" | "--output":
+                cmd["report_path"] = value
+            case "-i" | "--input":
+                cmd["archive_path"] = value
+            case "-d" | "--directory":
+                cmd["directory"] = value
             case unknown_command:
                 return Err(f"未知选项: {unknown_command}")
         i += 2
 
     if not cmd["config_path"]:
-        return Err("必须指定 --config 或 -c")
+        return Err("必须指定 --config 或 -c（或设置 PELIT_CONFIG 环境变量）")
+
+    if cmd["restore"] and not cmd["archive_path"]:
+        return Err("restore 必须指定 --input 或 -i")
 
     return Ok(cmd)
 
@@ -76,9 +120,16 @@ def parse_envvars() -> Result[Commandline_params, str]:
     """
     cmd: Commandline_params = {
         "check_only": False,
+        "scrub": False,
+        "restore": False,
         "config_path": "",
         "verbosity": 1,
-        "log_path": None
+        "log_path": None,
+        "jobs": 0,
+        "bandwidth": 0,
+        "report_path": None,
+        "archive_path": None,
+        "directory": ""
     }
 
     config_path = os.getenv('PELIT_CONFIG')
@@ -0,0 +1,100 @@
+import hashlib
+from typing import IO, Callable
+from pathlib import Path
+
+# 读取和写入文件时每次处理的块大小
+_CHUNK = 1024 * 1024
+
+def checksum_path(path: Path) -> Path:
+    """
+    文件对应的校验和文件，与文件放在同一目录，以 . 开头因此不会被列举或访问
+
+    Args:
+        path: 数据文件路径
+
+    Returns:
+        校验和文件路径，形如 .<文件名>.sha256
+    """
+    return path.with_name('.' + path.name + '.sha256')
+
+def data_path(path: Path) -> Path:
+    """
+    校验和文件对应的数据文件，是 checksum_path 的逆运算
+
+    Args:
+        path: 校验和文件路径
+
+    Returns:
+        数据文件路径
+    """
+    return path.with_name(path.name[1:-len('.sha256')])
+
+def is_checksum(path: Path) -> bool:
+    """
+    判断是否为校验和文件
+    """
+    return path.name.startswith('.') and path.name.endswith('.sha256')
+
+def save_with_checksum(stream: IO[bytes], path: Path) -> str:
+    """
+    保存上传的文件，同时计算 SHA256 并写入校验和文件，避免再读一遍
+
+    Args:
+        stream: 上传文件的数据流
+        path: 保存路径
+
+    Returns:
+        16 进制的 SHA256
+    """
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        while chunk := stream.read(_CHUNK):
+            digest.update(chunk)
+            f.write(chunk)
+    checksum_path(path).write_text(digest.hexdigest() + '\n')
+    return digest.hexdigest()
+
+def read_checksum(path: Path) -> str | None:
+    """
+    读取数据文件记录的校验和
+
+    Args:
+        path: 数据文件路径
+
+    Returns:
+        16 进制的 SHA256，没有记录时返回 None
+    """
+    try:
+        return checksum_path(path).read_text().strip().lower()
+    except FileNotFoundError:
+        return None
+
+def remove_checksum(path: Path):
+    """
+    删除数据文件对应的校验和文件，不存在时忽略
+
+    Args:
+        path: 数据文件路径
+    """
+    checksum_path(path).unlink(missing_ok=True)
+
+def hash_file(path: Path, throttle: Callable[[int], None] | None = None) -> tuple[str, int]:
+    """
+    计算文件的 SHA256
+
+    Args:
+        path: 文件路径
+        throttle: 每读取一块后以块大小调用，用于限制读取速度
+
+    Returns:
+        16 进制的 SHA256 和文件大小
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(_CHUNK):
+            digest.update(chunk)
+            size += len(chunk)
+            if throttle:
+                throttle(len(chunk))
+    return digest.hexdigest(), size
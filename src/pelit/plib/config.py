@@ -26,6 +26,10 @@ config_schema: JSONSchema = {
                 "hotlink_block": {
                     "type": "boolean"
                 },
+                "hotlink_mode": {
+                    "type": "string",
+                    "enum": ["referer", "signed", "both"]
+                },
                 "hotlink_whitelist": {
                     "type": "array",
                     "items": {
@@ -42,6 +46,17 @@ config_schema: JSONSchema = {
                 "path": {
                     "type": "string"
                 },
+                "backend": {
+                    "type": "string",
+                    "enum": ["local", "striped"]
+                },
+                "roots": {
+                    "type": "array",
+                    "minItems": 1,
+                    "items": {
+                        "type": "string"
+                    }
+                },
                 "warn": {
                     "type": "number",
                     "minimum": 0
@@ -51,6 +66,13 @@ config_schema: JSONSchema = {
                     "minimum": 0
                 }
             },
+            "if": {
+                "required": ["backend"],
+                "properties": {"backend": {"const": "striped"}}
+            },
+            "then": {
+                "required": ["roots"]
+            },
             "additionalProperties": False
         },
         "auth": {
@@ -69,6 +91,131 @@ config_schema: JSONSchema = {
                 {"required": ["hashed"]}
             ],
             "additionalProperties": False
+        },
+        "signing": {
+            "type": "object",
+            "properties": {
+                "from_env": {
+                    "type": "boolean"
+                },
+                "keys": {
+                    "type": "array",
+                    "minItems": 1,
+                    "items": {
+                        "type": "string",
+                        "minLength": 16
+                    }
+                },
+                "expires": {
+                    "type": "integer",
+                    "minimum": 1
+                }
+            },
+            "additionalProperties": False
+        },
+        "replication": {
+            "type": "object",
+            "required": ["mirrors"],
+            "properties": {
+                "mirrors": {
+                    "type": "array",
+                    "minItems": 1,
+                    "items": {
+                        "type": "string"
+                    }
+                },
+                "journal": {
+                    "type": "string"
+                },
+                "batch": {
+                    "type": "integer",
+                    "minimum": 1
+                },
+                "interval": {
+                    "type": "number",
+                    "exclusiveMinimum": 0
+                },
+                "max_lag": {
+                    "type": "number",
+                    "minimum": 0
+                }
+            },
+            "additionalProperties": False
+        },
+        "limit": {
+            "type": "object",
+            "properties": {
+                "key": {
+                    "type": "string",
+                    "enum": ["ip", "token"]
+                },
+                "proxy_hops": {
+                    "type": "integer",
+                    "minimum": 0
+                },
+                "slots": {
+                    "type": "integer",
+                    "minimum": 1
+                },
+                "stale": {
+                    "type": "number",
+                    "minimum": 0
+                },
+                "default": {
+                    "$ref": "#/definitions/limit_rule"
+                },
+                "routes": {
+                    "type": "object",
+                    "propertyNames": {
+                        "enum": ["upload", "delete", "list", "retrieve", "backup", "storage", "restore", "restore_status", "sign"]
+                    },
+                    "additionalProperties": {
+                        "$ref": "#/definitions/limit_rule"
+                    }
+                }
+            },
+            "additionalProperties": False
+        },
+        "profile": {
+            "type": "object",
+            "properties": {
+                "slow_ms": {
+                    "type": "number",
+                    "minimum": 0
+                },
+                "sample": {
+                    "type": "integer",
+                    "minimum": 0
+                },
+                "dir": {
+                    "type": "string"
+                },
+                "dump_every": {
+                    "type": "integer",
+                    "minimum": 1
+                }
+            },
+            "additionalProperties": False
+        }
+    },
+    "definitions": {
+        "limit_rule": {
+            "type": "object",
+            "properties": {
+                "rate": {
+                    "type": "number",
+                    "minimum": 0
+                },
+                "burst": {
+                    "type": "number",
+                    "minimum": 0
+                },
+                "concurrency": {
+                    "type": "integer",
+                    "minimum": 0
+                }
+            },
+            "additionalProperties": False
         }
     },
     "additionalProperties": False
@@ -0,0 +1,171 @@
+import math
+import mmap
+import time
+import struct
+import hashlib
+from typing import Any
+from multiprocessing import Lock
+
+# 每个槽位的格式：客户端键（0 表示空槽）、剩余令牌、上次更新时间、进行中的请求数
+_SLOT = struct.Struct("<Qddq")
+
+# 线性探测的最大步数，超过则淘汰探测范围内最旧的槽位
+_PROBE = 8
+
+# 未在配置文件中指定时使用的限制；较重的接口默认更严格
+_DEFAULT_RULES: dict[str, dict[str, float]] = {
+    "default": {"rate": 0, "burst": 0, "concurrency": 0},
+    "backup": {"rate": 1 / 60, "burst": 1, "concurrency": 1},
+}
+
+class p_limiter:
+    """
+    基于共享内存的令牌桶限速和并发限制，在 Gunicorn 的各 worker 之间共享状态
+
+    共享内存是匿名 mmap，必须在 fork 之前创建，即 Gunicorn 需开启 preload_app；
+    否则每个 worker 各自计数，限制会按 worker 数放大
+
+    Attributes:
+        by_token: 是否按认证通过的密钥区分客户端（key = "token"），否则按 IP
+        _slots: [INTERNAL] 槽位数量
+        _stale: [INTERNAL] 槽位多久无活动后视为过期（秒），用于回收被杀死的 worker 遗留的并发计数
+        _rules: [INTERNAL] 每个路径的 rate、burst、concurrency
+        _mem: [INTERNAL] 共享内存
+        _lock: [INTERNAL] 跨进程锁
+    """
+    def __init__(self, cfg: dict[str, Any]):
+        """
+        根据配置文件的 limit 部分创建限制器
+
+        Args:
+            cfg: 配置文件中的 limit 部分
+        """
+        self.by_token: bool = cfg.get('key', 'ip') == 'token'
+        self._slots: int = cfg.get('slots', 4096)
+        self._stale: float = cfg.get('stale', 60)
+
+        self._rules: dict[str, dict[str, float]] = {}
+        for name, rule in _DEFAULT_RULES.items():
+            self._rules[name] = dict(rule)
+        if 'default' in cfg:
+            self._rules['default'].update(cfg['default'])
+        for name, rule in cfg.get('routes', {}).items():
+            merged = dict(self._rules.get(name, self._rules['default']))
+            merged.update(rule)
+            self._rules[name] = merged
+
+        self._mem = mmap.mmap(-1, _SLOT.size * self._slots,
+                              flags=mmap.MAP_SHARED | mmap.MAP_ANONYMOUS)
+        self._lock = Lock()
+
+    def client_key(self, route: str, addr: str | None, token: str | None) -> int:
+        """
+        计算客户端在某个路径上的键
+
+        Args:
+            route: 路径名，如 upload、backup
+            addr: 客户端 IP
+            token: 已通过认证的 Authorization 头，仅在 by_token 时使用，为 None 时退回 IP；
+                未认证的请求头可以任意伪造，不能用于区分客户端
+
+        Returns:
+            非零的 64 位整数
+        """
+        ident = f"token:{token}" if self.by_token and token else f"ip:{addr or ''}"
+        digest = hashlib.blake2b(f"{route}\0{ident}".encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') or 1
+
+    def _rule(self, route: str) -> dict[str, float]:
+        """
+        [INTERNAL] 获取路径对应的限制，未单独配置时使用 default
+        """
+        return self._rules.get(route, self._rules['default'])
+
+    def _find(self, key: int, now: float, create: bool) -> int:
+        """
+        [INTERNAL] 查找键所在的槽位，调用时必须持有锁
+
+        Args:
+            key: 客户端键
+            now: 当前时间
+            create: 未找到时是否占用一个空槽或淘汰一个旧槽
+
+        Returns:
+            槽位的偏移量，未找到且不创建时返回 -1
+        """
+        start = key % self._slots
+        victim = -1
+        victim_stamp = math.inf
+        for i in range(_PROBE):
+            offset = ((start + i) % self._slots) * _SLOT.size
+            slot_key, _, stamp, inflight = _SLOT.unpack_from(self._mem, offset)
+            if slot_key == key:
+                return offset
+            if not create:
+                continue
+            if slot_key == 0:
+                if victim_stamp > -math.inf:
+                    victim, victim_stamp = offset, -math.inf
+                continue
+            # 优先淘汰没有进行中请求的槽位
+            if inflight > 0 and now - stamp < self._stale:
+                continue
+            if stamp < victim_stamp:
+                victim, victim_stamp = offset, stamp
+        if victim >= 0:
+            _SLOT.pack_into(self._mem, victim, key, math.inf, now, 0)
+        return victim
+
+    def acquire(self, route: str, key: int) -> int:
+        """
+        尝试为一次请求消耗一个令牌并占用一个并发名额
+
+        Args:
+            route: 路径名
+            key: client_key 返回的客户端键
+
+        Returns:
+            一个 int，0 = 允许，否则为建议的 Retry-After 秒数
+        """
+        rule = self._rule(route)
+        rate, burst, concurrency = rule['rate'], rule['burst'], rule['concurrency']
+        if rate <= 0 and concurrency <= 0:
+            return 0
+
+        now = time.monotonic()
+        with self._lock:
+            offset = self._find(key, now, create=True)
+            # 探测范围内全是活跃的槽位，放行而不是误伤
+            if offset < 0:
+                return 0
+            _, tokens, stamp, inflight = _SLOT.unpack_from(self._mem, offset)
+
+            if now - stamp > self._stale:
+                inflight = 0
+            if concurrency > 0 and inflight >= concurrency:
+                return 1
+
+            if rate > 0:
+                tokens = min(max(burst, 1), tokens + (now - stamp) * rate)
+                if tokens < 1:
+                    _SLOT.pack_into(self._mem, offset, key, tokens, now, inflight)
+                    return math.ceil((1 - tokens) / rate)
+                tokens -= 1
+
+            _SLOT.pack_into(self._mem, offset, key, tokens, now, inflight + 1)
+            return 0
+
+    def release(self, key: int):
+        """
+        请求结束时归还并发名额
+
+        Args:
+            key: acquire 时使用的客户端键
+        """
+        now = time.monotonic()
+        with self._lock:
+            offset = self._find(key, now, create=False)
+            if offset < 0:
+                return
+            _, tokens, stamp, inflight = _SLOT.unpack_from(self._mem, offset)
+            _SLOT.pack_into(self._mem, offset, key, tokens, stamp, max(inflight - 1, 0))
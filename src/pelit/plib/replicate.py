@@ -0,0 +1,365 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import threading
+from typing import Any, IO
+from pathlib import Path
+from pelit.plib.log import p_logger
+from pelit.plib.storage import p_storage, is_healthy
+from pelit.plib.checksum import checksum_path
+
+class p_replicator:
+    """
+    异步复制到镜像根目录
+
+    上传和删除时向本地日志追加一条事件（fsync 后才返回），由后台线程分批应用到所有镜像；
+    恢复备份后为每个替换的目录追加一条 sync 事件，使镜像中的目录与主存储一致。
+    多个 worker 中只有持有 leader 锁的一个运行复制，它退出后其他 worker 会接替。
+    已应用的位置保存在 <journal>.offset 中，全部应用后日志会被清空
+
+    Attributes:
+        mirrors: 镜像根目录，布局与 storage.path 相同（<镜像>/<目录>/<文件>）
+        _storage: [INTERNAL] 存储后端
+        _lg: [INTERNAL] 日志
+        _journal: [INTERNAL] 日志文件
+        _offset: [INTERNAL] 已应用位置的记录文件
+        _leader: [INTERNAL] leader 锁文件
+        _batch: [INTERNAL] 每批最多应用的事件数
+        _interval: [INTERNAL] 没有新事件时的检查间隔（秒）
+        _max_lag: [INTERNAL] 延迟超过此值（秒）时警告
+        _pid: [INTERNAL] 已启动复制线程的进程，fork 后需要重新启动
+        _index: [INTERNAL] 日志中每个文件（sync 为目录）最后一个事件及其结束位置，供 fallback 使用
+        _scanned: [INTERNAL] _index 已读取到的日志位置
+        _tail: [INTERNAL] _scanned 之前的最后一行，用于发现日志已被清空重写
+        _index_lock: [INTERNAL] 保护 _index，适用于多线程 worker
+    """
+    def __init__(self, cfg: dict[str, Any], storage: p_storage, path: str, lg: p_logger):
+        """
+        Args:
+            cfg: 配置文件中的 replication 部分
+            storage: 存储后端
+            path: storage.path，日志默认保存在此目录
+            lg: 日志
+        """
+        self.mirrors = [Path(mirror) for mirror in cfg['mirrors']]
+        self._storage = storage
+        self._lg = lg
+        self._journal = Path(cfg.get('journal', str(Path(path) / '.pelit-journal')))
+        self._offset = self._journal.with_name(self._journal.name + '.offset')
+        self._leader = self._journal.with_name(self._journal.name + '.lock')
+        self._batch: int = cfg.get('batch', 100)
+        self._interval: float = cfg.get('interval', 1)
+        self._max_lag: float = cfg.get('max_lag', 60)
+        self._pid = 0
+        self._index: dict[tuple[str, str], tuple[str, int]] = {}
+        self._scanned = 0
+        self._tail = b''
+        self._index_lock = threading.Lock()
+
+    def record(self, op: str, directory: str, file: str):
+        """
+        追加一条事件，写入磁盘后返回
+
+        Args:
+            op: "put"、"delete" 或 "sync"（同步整个目录）
+            directory: 文件所在目录
+            file: 文件名，sync 时为空字符串
+        """
+        line = json.dumps({"t": time.time(), "op": op, "dir": directory, "file": file},
+                          ensure_ascii=False) + '\n'
+        fd = os.open(self._journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # 共享锁：可以并发追加，但不能与清空日志同时进行
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            os.write(fd, line.encode('utf-8'))
+            os.fdatasync(fd)
+        finally:
+            os.close(fd)
+
+    def ensure_started(self):
+        """
+        在当前进程中启动复制线程（每个进程一次），应在请求中调用，因为线程不会跨 fork 保留
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        threading.Thread(target=self._run, name="pelit-replicator", daemon=True).start()
+
+    def _read_offset(self) -> int:
+        """
+        [INTERNAL] 读取已应用的位置
+        """
+        try:
+            return int(self._offset.read_text())
+        except (OSError, ValueError):
+            return 0
+
+    def _write_offset(self, offset: int):
+        """
+        [INTERNAL] 保存已应用的位置
+        """
+        tmp = self._offset.with_name(self._offset.name + '.tmp')
+        tmp.write_text(str(offset))
+        os.replace(tmp, self._offset)
+
+    def _pending(self, offset: int, limit: int) -> tuple[list[dict[str, Any]], int]:
+        """
+        [INTERNAL] 读取 offset 之后最多 limit 条完整的事件
+
+        Returns:
+            事件列表和读取后的位置
+        """
+        events: list[dict[str, Any]] = []
+        try:
+            with open(self._journal, 'rb') as f:
+                # 清空日志后、保存位置前中断时，记录的位置会超过日志长度
+                if offset > os.fstat(f.fileno()).st_size:
+                    offset = 0
+                f.seek(offset)
+                while len(events) < limit:
+                    line = f.readline()
+                    # 没有换行符说明另一个进程还没写完
+                    if not line.endswith(b'\n'):
+                        break
+                    offset += len(line)
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        self._lg.warn(f"复制日志中有无效的事件，已跳过: {line!r}")
+        except FileNotFoundError:
+            pass
+        return events, offset
+
+    def _sync(self, mirror: Path, directory: str):
+        """
+        [INTERNAL] 使镜像中的目录与主存储一致：复制所有文件，删除主存储中已不存在的文件
+        """
+        # 根目录不可用时看不到其中的文件，不能据此删除镜像
+        for root in self._storage.roots:
+            if not is_healthy(root):
+                raise OSError(f"存储根目录不可用: {root}")
+        sources: dict[str, Path] = {}
+        for root in self._storage.roots:
+            path = root / directory
+            if path.is_dir():
+                for item in path.iterdir():
+                    if item.is_file() and not item.name.endswith('.tmp'):
+                        sources[item.name] = item
+        target_dir = mirror / directory
+        if target_dir.is_dir():
+            for item in target_dir.iterdir():
+                if item.is_file() and item.name not in sources:
+                    item.unlink()
+        if not sources:
+            return
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for name, src in sources.items():
+            tmp = target_dir / (name + '.tmp')
+            shutil.copy2(src, tmp)
+            os.replace(tmp, target_dir / name)
+
+    def _apply(self, events: list[dict[str, Any]]):
+        """
+        [INTERNAL] 把一批事件应用到所有镜像，同一文件只应用最后一个事件
+
+        失败时抛出异常，整批稍后重试（所有操作都可以重复执行）
+        """
+        latest: dict[tuple[str, str], str] = {}
+        for event in events:
+            latest[(event['dir'], event['file'])] = event['op']
+
+        for mirror in self.mirrors:
+            if not is_healthy(mirror):
+                raise OSError(f"镜像不可用: {mirror}")
+            for (directory, file), op in latest.items():
+                if op == 'sync':
+                    self._sync(mirror, directory)
+                    continue
+                target = mirror / directory / file
+                if op == 'delete':
+                    target.unlink(missing_ok=True)
+                    checksum_path(target).unlink(missing_ok=True)
+                    continue
+                source = self._storage.locate(directory, file)
+                if not source.exists():
+                    # 根目录不可用时文件只是暂时看不到，整批稍后重试，否则此文件永远不会复制
+                    if not is_healthy(source.parents[1]):
+                        raise OSError(f"存储根目录不可用: {source.parents[1]}")
+                    # 文件已被删除，之后的 delete 事件会处理镜像
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                for src, dst in ((source, target), (checksum_path(source), checksum_path(target))):
+                    if not src.exists():
+                        continue
+                    tmp = dst.with_name(dst.name + '.tmp')
+                    shutil.copy2(src, tmp)
+                    os.replace(tmp, dst)
+
+    def _compact(self, offset: int) -> int:
+        """
+        [INTERNAL] 所有事件都已应用时清空日志
+
+        Returns:
+            新的位置
+        """
+        try:
+            fd = os.open(self._journal, os.O_WRONLY)
+        except FileNotFoundError:
+            return offset
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size == offset:
+                # 先保存位置：在两步之间中断时只会重复应用，而不是跳过之后追加的事件
+                self._write_offset(0)
+                os.ftruncate(fd, 0)
+                return 0
+            return offset
+        finally:
+            os.close(fd)
+
+    def _lead(self, lock: IO[bytes]) -> bool:
+        """
+        [INTERNAL] 尝试取得 leader 锁
+
+        使用 lockf（POSIX 记录锁）而不是 flock：记录锁属于进程，不会被 fork 出的子进程
+        （如恢复和备份任务）继承；flock 跟随文件描述符，worker 退出后子进程仍会占用锁，
+        其他 worker 无法接替
+
+        Args:
+            lock: 以写方式打开的 leader 锁文件，持有期间不能关闭
+
+        Returns:
+            True 表示成为 leader
+        """
+        try:
+            fcntl.lockf(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def _run(self):
+        """
+        [INTERNAL] 复制线程：争取 leader 锁，成为 leader 后持续应用事件
+        """
+        lock = open(self._leader, 'ab')
+        while not self._lead(lock):
+            time.sleep(self._interval * 5)
+
+        delay = self._interval
+        offset = self._read_offset()
+        warned = False
+        while True:
+            events, next_offset = self._pending(offset, self._batch)
+            if not events:
+                if next_offset != offset:
+                    offset = next_offset
+                    self._write_offset(offset)
+                offset = self._compact(offset)
+                time.sleep(self._interval)
+                continue
+
+            try:
+                self._apply(events)
+            except Exception as e:
+                self._lg.warn(f"复制失败，{delay:.0f} 秒后重试: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+            delay = self._interval
+            offset = next_offset
+            self._write_offset(offset)
+
+            lag = time.time() - events[-1]['t']
+            if lag > self._max_lag and not warned:
+                self._lg.warn(f"复制延迟 {lag:.0f} 秒，超过 {self._max_lag} 秒")
+            warned = lag > self._max_lag
+
+    def status(self) -> dict[str, Any]:
+        """
+        报告复制状态
+
+        Returns:
+            lag（最早未应用事件的等待秒数）、pending（未应用的日志字节数）和各镜像是否可用
+        """
+        offset = self._read_offset()
+        events, _ = self._pending(offset, 1)
+        try:
+            pending = max(self._journal.stat().st_size - offset, 0)
+        except FileNotFoundError:
+            pending = 0
+        return {
+            "lag": time.time() - events[0]['t'] if events else 0,
+            "pending": pending,
+            "mirrors": [{"path": str(mirror), "healthy": is_healthy(mirror)} for mirror in self.mirrors]
+        }
+
+    def _scan(self):
+        """
+        [INTERNAL] 把上次读取之后追加的事件加入 _index，调用时必须持有 _index_lock
+
+        日志被清空后重新写入时，_scanned 之前的内容会变化，此时从头读取
+        """
+        try:
+            with open(self._journal, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < self._scanned:
+                    self._reset_index()
+                elif self._scanned > 0:
+                    f.seek(self._scanned - len(self._tail))
+                    if f.read(len(self._tail)) != self._tail:
+                        self._reset_index()
+                f.seek(self._scanned)
+                while True:
+                    line = f.readline()
+                    if not line.endswith(b'\n'):
+                        break
+                    self._scanned += len(line)
+                    self._tail = line
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    key = (event['dir'], '' if event['op'] == 'sync' else event['file'])
+                    self._index[key] = (event['op'], self._scanned)
+        except FileNotFoundError:
+            self._reset_index()
+
+    def _reset_index(self):
+        """
+        [INTERNAL] 清空 _index，调用时必须持有 _index_lock
+        """
+        self._index.clear()
+        self._scanned = 0
+        self._tail = b''
+
+    def fallback(self, directory: str, file: str) -> Path | None:
+        """
+        在镜像中查找文件，仅用于文件所在的主存储根目录不可用时
+
+        主存储可用时文件缺失说明已被删除（或被恢复替换），镜像可能还没有同步，不能返回；
+        日志中尚未应用的删除同样视为已删除
+
+        Args:
+            directory: 文件所在目录
+            file: 文件名
+
+        Returns:
+            第一个找到的镜像文件，主存储可用、文件已删除或镜像中都没有时返回 None
+        """
+        if is_healthy(self._storage.locate(directory, file).parents[1]):
+            return None
+        # 只读取新追加的日志，故障期间每次请求不必重新解析整个日志
+        with self._index_lock:
+            self._scan()
+            applied = self._read_offset()
+            for key, blocking in (((directory, ''), 'sync'), ((directory, file), 'delete')):
+                op, end = self._index.get(key, ('', 0))
+                if op == blocking and end > applied:
+                    return None
+        for mirror in self.mirrors:
+            path = mirror / directory / file
+            if path.is_file():
+                return path
+        return None
@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import tarfile
+import secrets
+import hashlib
+from typing import Any, Callable, IO
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Condition
+from pelit.plib.result import Ok, Err, Result
+from pelit.plib.storage import p_storage
+from pelit.plib.replicate import p_replicator
+from pelit.plib.checksum import is_checksum, data_path
+from pelit.plib.route_tool import is_attempting_traversal
+
+# 超过此大小的文件直接在读取线程中写入，不占用内存排队
+_LARGE = 4 * 1024 * 1024
+
+# 排队等待写入的文件合计最多占用的内存
+_QUEUE = 64 * 1024 * 1024
+
+# 读取和写入文件时每次处理的块大小
+_CHUNK = 1024 * 1024
+
+def _write(path: Path, data: bytes) -> str:
+    """
+    [INTERNAL] 在写入线程中保存文件
+
+    Returns:
+        16 进制的 SHA256
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return hashlib.sha256(data).hexdigest()
+
+def _write_stream(path: Path, stream: IO[bytes]) -> str:
+    """
+    [INTERNAL] 在读取线程中分块保存大文件
+
+    Returns:
+        16 进制的 SHA256
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        while chunk := stream.read(_CHUNK):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+def _split(name: str, directory: str) -> tuple[str, str] | None | bool:
+    """
+    [INTERNAL] 检查并拆分归档中的条目名
+
+    Args:
+        name: 条目名
+        directory: 目录备份恢复到的目录，空字符串表示完整备份
+
+    Returns:
+        (目录, 文件名)；None 表示跳过（如顶层文件、隐藏目录）；False 表示危险条目
+    """
+    if name.startswith('/'):
+        return False
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if any(is_attempting_traversal(part) for part in parts):
+        return False
+    if directory:
+        parts = [directory] + parts
+    # 隐藏目录（如旧版本打包进去的恢复临时目录）可以有更深的层级，整体跳过
+    if parts and parts[0].startswith('.'):
+        return None
+    if len(parts) != 2:
+        return False if len(parts) > 2 else None
+    return parts[0], parts[1]
+
+def _extract(storage: p_storage,
+             archive: Path,
+             directory: str,
+             staging: dict[Path, Path],
+             jobs: int,
+             progress: Callable[[int, int, int], None] | None) -> Result[dict[str, Any], str]:
+    """
+    [INTERNAL] 把归档解压到各根目录的临时目录，并与归档中的校验和比较
+
+    Returns:
+        恢复的目录、文件数和字节数，或报错信息
+    """
+    total = archive.stat().st_size
+    restored: set[str] = set()
+    files = 0
+    size = 0
+    digests: dict[Path, Future[str] | str] = {}
+    expected: dict[Path, str] = {}
+
+    # 限制排队等待写入的字节数，避免占用过多内存
+    queued = 0
+    queue = Condition()
+
+    def written(n: int):
+        nonlocal queued
+        with queue:
+            queued -= n
+            queue.notify()
+
+    with open(archive, 'rb') as raw, \
+            tarfile.open(fileobj=raw, mode='r|gz') as tar, \
+            ThreadPoolExecutor(max_workers=jobs) as pool:
+        last = 0.0
+        for member in tar:
+            split = _split(member.name, directory)
+            if split is False:
+                return Err(f"危险的条目: {member.name}")
+            if member.isdir() or split is None:
+                continue
+            if not member.isfile():
+                return Err(f"不支持的条目类型: {member.name}")
+            assert isinstance(split, tuple)
+            d, name = split
+
+            # 校验和文件和数据文件放在同一根目录
+            sidecar = is_checksum(Path(name))
+            located = storage.locate(d, data_path(Path(name)).name if sidecar else name)
+            target = staging[located.parent.parent] / d / name
+            restored.add(d)
+
+            stream = tar.extractfile(member)
+            assert stream is not None
+            if sidecar:
+                expected[data_path(target)] = stream.read().decode('utf-8').strip().lower()
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_text(expected[data_path(target)] + '\n')
+            elif member.size > _LARGE:
+                digests[target] = _write_stream(target, stream)
+            else:
+                with queue:
+                    queue.wait_for(lambda: queued + member.size <= _QUEUE)
+                    queued += member.size
+                future = pool.submit(_write, target, stream.read())
+                future.add_done_callback(lambda _, n=member.size: written(n))
+                digests[target] = future
+            files += 1
+            size += member.size
+
+            if progress and time.monotonic() - last > 1:
+                last = time.monotonic()
+                progress(raw.tell(), total, files)
+
+        # 等待所有写入完成，并与归档中的校验和比较
+        actual = {path: value if isinstance(value, str) else value.result()
+                  for path, value in digests.items()}
+        for path, digest in expected.items():
+            if path in actual and actual[path] != digest:
+                return Err(f"校验和不符: {path.relative_to(path.parents[1])}")
+
+    if progress:
+        progress(total, total, files)
+    return Ok({
+        "directories": sorted(restored),
+        "files": files,
+        "bytes": size
+    })
+
+def restore_from_file(storage: p_storage,
+                      archive: Path,
+                      directory: str = "",
+                      jobs: int = 8,
+                      progress: Callable[[int, int, int], None] | None = None) -> Result[dict[str, Any], str]:
+    """
+    从备份归档中恢复，先解压到各根目录下的临时目录，全部成功后再替换
+
+    gzip 只能顺序解压，因此由当前线程解压，文件写入和校验由线程池并行完成。
+    归档中的每个目录整体替换现有的同名目录（在所有根目录上），不在归档中的目录不受影响。
+    被替换的目录移到 <根目录>/.pelit-restore-old-<随机串>/ 下保留，由管理员确认后删除，
+    其中可能有备份之后上传的文件
+
+    Args:
+        storage: 存储后端
+        archive: 备份归档（.tar.gz）
+        directory: 目录备份（/backup/<directory>）需要指定恢复到的目录，完整备份留空
+        jobs: 写入线程数
+        progress: 进度回调，参数为已读取的归档字节数、归档总字节数、已恢复的文件数
+
+    Returns:
+        恢复的目录、文件数、字节数和保留被替换目录的位置（previous），或报错信息
+    """
+    token = secrets.token_hex(6)
+    staging = {root: root / f".pelit-restore-{token}" for root in storage.roots}
+    kept = {root: root / f".pelit-restore-old-{token}" for root in storage.roots}
+
+    def cleanup():
+        for path in staging.values():
+            shutil.rmtree(path, ignore_errors=True)
+
+    try:
+        result = _extract(storage, archive, directory, staging, jobs, progress)
+    except (OSError, tarfile.TarError, EOFError, UnicodeDecodeError) as e:
+        result = Err(f"{archive}: 无效的归档或写入失败: {e}")
+    if isinstance(result, Err):
+        cleanup()
+        return result
+    if result.value['files'] == 0:
+        cleanup()
+        hint = "" if directory else "，目录备份需要指定恢复到的目录"
+        return Err(f"{archive}: 归档中没有可恢复的文件{hint}")
+
+    # 逐个替换目录（同一文件系统内 rename 是原子的），失败时撤销已完成的替换
+    swapped: list[tuple[Path, Path | None]] = []
+    try:
+        for d in result.value['directories']:
+            for root, stage_dir in staging.items():
+                staged = stage_dir / d
+                staged.mkdir(parents=True, exist_ok=True)
+                live = root / d
+                if live.exists():
+                    old = kept[root] / d
+                    old.parent.mkdir(parents=True, exist_ok=True)
+                    os.rename(live, old)
+                    swapped.append((live, old))
+                os.rename(staged, live)
+                swapped.append((live, None))
+    except OSError as e:
+        for live, old in reversed(swapped):
+            if old is None:
+                os.rename(live, staging[live.parent] / live.name)
+            else:
+                os.rename(old, live)
+        for path in kept.values():
+            shutil.rmtree(path, ignore_errors=True)
+        cleanup()
+        return Err(f"替换目录失败: {e}")
+
+    cleanup()
+    result.value['previous'] = [str(path) for path in kept.values() if path.exists()]
+    return result
+
+def restore_with_status(storage: p_storage,
+                        archive: Path,
+                        directory: str,
+                        status: Path,
+                        replicator: p_replicator | None = None):
+    """
+    在后台进程中恢复，进度和结果写入状态文件，供 GET /restore 查询
+
+    Args:
+        storage: 存储后端
+        archive: 备份归档
+        directory: 同 restore_from_file
+        status: 状态文件
+        replicator: 启用复制时，为恢复的目录写入 sync 事件
+    """
+    def write(state: dict[str, Any]):
+        tmp = status.with_name(status.name + '.tmp')
+        tmp.write_text(json.dumps(state, ensure_ascii=False), 'utf-8')
+        os.replace(tmp, status)
+
+    base: dict[str, Any] = {"pid": os.getpid(), "archive": archive.name, "directory": directory}
+    write(base | {"state": "running", "read": 0, "total": archive.stat().st_size, "files": 0})
+
+    def progress(read: int, total: int, files: int):
+        write(base | {"state": "running", "read": read, "total": total, "files": files})
+
+    try:
+        result = restore_from_file(storage, archive, directory, progress=progress)
+    except Exception as e:
+        write(base | {"state": "failed", "message": str(e)})
+        return
+    if isinstance(result, Err):
+        write(base | {"state": "failed", "message": str(result)})
+        return
+    try:
+        if replicator is not None:
+            for d in result.value['directories']:
+                replicator.record('sync', d, '')
+    except Exception as e:
+        write(base | {"state": "failed", "message": f"恢复成功，但写入复制日志失败，镜像未同步: {e}"})
+        return
+    write(base | {"state": "done"} | result.value)
+
+def try_lock(lock: Path) -> int | None:
+    """
+    获取恢复任务的锁，同一时间只允许一个恢复任务
+
+    锁是 flock，跟随文件描述符：fork 出的恢复进程继承描述符后，父进程可以关闭自己的副本，
+    锁在恢复进程退出时自动释放
+
+    Args:
+        lock: 锁文件
+
+    Returns:
+        持有锁的文件描述符，已有恢复任务时返回 None
+    """
+    fd = os.open(lock, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+def read_status(status: Path) -> dict[str, Any] | None:
+    """
+    读取恢复任务的状态；进程已退出但状态仍为 running 时视为失败
+
+    Args:
+        status: 状态文件
+
+    Returns:
+        状态，没有恢复任务时返回 None
+    """
+    try:
+        state: dict[str, Any] = json.loads(status.read_text('utf-8'))
+    except (OSError, ValueError):
+        return None
+    if state.get('state') == 'running':
+        try:
+            os.kill(state['pid'], 0)
+        except (OSError, KeyError):
+            state['state'] = 'failed'
+            state['message'] = "恢复进程意外退出"
+    return state
@@ -1,10 +1,12 @@
 import os
+import re
 import secrets
 import hashlib
 from typing import Optional, Any
 from pathlib import Path
 from flask import request
-import shutil
+import tarfile
+from pelit.plib.storage import p_storage
 
 def authenticate(cfg: dict[str, Any]) -> bool:
     """
@@ -50,15 +52,18 @@ def generate_file_name(directory: Path, extension: str) -> str:
         if not full_path.exists():
             return filename
 
-def enough_space(cfg: dict[str, Any]) -> int:
+def enough_space(cfg: dict[str, Any], storage: p_storage) -> int:
     """
     [INTERNAL] 检查数据目录大小是否超过 warn 和 max 限制
 
+    Args:
+        cfg: 配置文件
+        storage: 存储后端，统计其所有根目录
+
     Returns:
         一个 int，0 = 未超限，1 = 超过 warn，2 = 超过 max
     """
-    storage = Path(cfg['storage']['path'])
-    size = sum(f.stat().st_size for f in storage.rglob('*') if f.is_file()) / 1024 / 1024
+    size = storage.usage() / 1024 / 1024
     
     if 'max' in cfg['storage']:
         if size > cfg['storage']['max'] and cfg['storage']['max'] != 0:
@@ -84,8 +89,44 @@ def join_url(a: str, b: str) -> str:
     b = b.lstrip('/')
     return a + '/' + b
 
-def list_dir(path: Path) -> list[str]:
-    return [item.name for item in path.iterdir() if not item.name.startswith('.')]
+def compile_whitelist(rules: list[str]) -> list[tuple[str, re.Pattern[str] | None]]:
+    """
+    预先编译反盗链白名单，避免每个请求重复解析正则表达式
+
+    Args:
+        rules: 配置文件中的 hotlink_whitelist
+
+    Returns:
+        (原始规则, 编译后的正则)；无法编译的规则只做直接匹配
+    """
+    compiled: list[tuple[str, re.Pattern[str] | None]] = []
+    for rule in rules:
+        try:
+            compiled.append((rule, re.compile(rule)))
+        except re.error:
+            compiled.append((rule, None))
+    return compiled
+
+def referer_allowed(referer: str | None, whitelist: list[tuple[str, re.Pattern[str] | None]]) -> bool:
+    """
+    检查 Referer 是否在反盗链白名单中
+
+    Args:
+        referer: 请求的 Referer 头
+        whitelist: compile_whitelist 编译的白名单
+
+    Returns:
+        True 表示允许
+    """
+    if not referer:
+        return False
+    for rule, pattern in whitelist:
+        # 也允许直接匹配（忽略 . 在 RegEx 中的作用）
+        if referer == rule:
+            return True
+        if pattern is not None and pattern.fullmatch(referer):
+            return True
+    return False
 
 def is_attempting_traversal(comp: str) -> bool:
     """
@@ -101,17 +142,24 @@ def is_attempting_traversal(comp: str) -> bool:
         return True
     return False
 
-def backup_to_file(path: Path, file: Path) -> None:
+def backup_to_file(paths: list[Path], file: Path) -> None:
     """
-    创建全目录备份
+    创建全目录备份，多个目录的内容合并到同一个归档中
 
     Args:
-        path: 需要备份的目录
-        file: 备份保存的文件
+        paths: 需要备份的目录，通常是各存储根目录下的同一目录
+        file: 备份保存的文件，不含 .tar.gz 后缀
     """
-    print(path, file)
-
+    archive = Path(str(file) + '.tar.gz')
     try:
-        shutil.make_archive(str(file), 'gztar', str(path))
+        with tarfile.open(str(archive), 'w:gz') as tar:
+            for path in paths:
+                if not path.is_dir():
+                    continue
+                for item in path.iterdir():
+                    # 不要把正在写入的归档自身和正在进行的恢复的临时目录也打包进去
+                    if item == archive or item.name.startswith('.pelit-restore-'):
+                        continue
+                    tar.add(str(item), arcname=item.name)
     except Exception:
         pass
@@ -0,0 +1,160 @@
+import os
+import json
+import time
+from typing import Any, Iterator
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from pelit.plib.log import p_logger
+from pelit.plib.storage import p_storage
+from pelit.plib.checksum import data_path, is_checksum, read_checksum, hash_file
+
+# 每批提交给进程池的文件数（乘以进程数），每批结束后保存一次进度
+_BATCH = 16
+
+# [INTERNAL] 工作进程内的限速状态：开始时间、已读取字节数、速度上限（字节/秒）
+_budget: list[float] = [0, 0, 0]
+
+def _init_worker(rate: float):
+    """
+    [INTERNAL] 工作进程初始化，设置该进程的读取速度上限
+    """
+    _budget[0] = time.monotonic()
+    _budget[1] = 0
+    _budget[2] = rate
+
+def _throttle(size: int):
+    """
+    [INTERNAL] 累计读取量，超过速度上限时休眠
+    """
+    _budget[1] += size
+    ahead = _budget[1] / _budget[2] - (time.monotonic() - _budget[0])
+    if ahead > 0:
+        time.sleep(ahead)
+
+def _verify(path: str) -> tuple[str, str | None, int]:
+    """
+    [INTERNAL] 在工作进程中计算文件的校验和
+
+    Returns:
+        路径、16 进制 SHA256（读取失败时为 None）和大小
+    """
+    try:
+        digest, size = hash_file(Path(path), _throttle if _budget[2] > 0 else None)
+        return path, digest, size
+    except OSError:
+        return path, None, 0
+
+def _walk(storage: p_storage) -> Iterator[tuple[str, Path]]:
+    """
+    [INTERNAL] 按固定顺序遍历所有根目录下的上传文件（<根目录>/<目录>/<文件>）
+
+    顶层的文件（如备份归档）和隐藏目录不在检查范围内
+
+    Returns:
+        (排序键, 路径)，排序键用于断点续传，遍历顺序与排序键的字符串顺序一致
+    """
+    for i, root in enumerate(storage.roots):
+        if not root.is_dir():
+            continue
+        # 按排序键中的 "<目录>/" 排序，否则 img-old 会排在 img 之后，续传时被跳过
+        for directory in sorted(root.iterdir(), key=lambda d: d.name + '/'):
+            if directory.name.startswith('.') or not directory.is_dir():
+                continue
+            for file in sorted(directory.iterdir()):
+                if file.is_file():
+                    yield f"{i:04d}/{directory.name}/{file.name}", file
+
+def _new_report() -> dict[str, Any]:
+    """
+    [INTERNAL] 空的检查报告
+    """
+    return {
+        "started": datetime.now().isoformat(timespec='seconds'),
+        "finished": None,
+        "checked": 0,
+        "bytes": 0,
+        "missing": [],
+        "corrupt": [],
+        "unexpected": [],
+        "unreadable": []
+    }
+
+def scrub(storage: p_storage,
+          state: Path,
+          lg: p_logger,
+          jobs: int = 0,
+          bandwidth: float = 0) -> dict[str, Any]:
+    """
+    重新计算所有上传文件的校验和，与上传时记录的比较
+
+    进度保存在 state 中，中断后再次运行会从上次的位置继续；全部完成后删除 state
+
+    Args:
+        storage: 存储后端
+        state: 进度文件
+        lg: 日志
+        jobs: 进程数，0 表示 CPU 核数
+        bandwidth: 所有进程合计的读取速度上限（MB/s），0 表示不限制
+
+    Returns:
+        检查报告，包含 missing（有校验和但文件不存在）、corrupt（校验和不符）、
+        unexpected（没有校验和的文件）和 unreadable（无法读取的文件）
+    """
+    jobs = jobs or os.cpu_count() or 1
+    cursor = ""
+    report = _new_report()
+    if state.exists():
+        try:
+            saved = json.loads(state.read_text('utf-8'))
+            cursor, report = saved['cursor'], saved['report']
+            lg.info(f"从上次的位置继续: {cursor}")
+        except (OSError, ValueError, KeyError):
+            lg.warn(f"{state}: 无效的进度文件，重新开始")
+
+    def save_state(cursor: str):
+        tmp = state.with_name(state.name + '.tmp')
+        tmp.write_text(json.dumps({"cursor": cursor, "report": report}, ensure_ascii=False), 'utf-8')
+        os.replace(tmp, state)
+
+    rate = bandwidth * 1024 * 1024 / jobs
+    batch: list[tuple[str, Path, str]] = []
+
+    def run_batch(pool: ProcessPoolExecutor):
+        expected = {str(path): digest for _, path, digest in batch}
+        for path, actual, size in pool.map(_verify, expected.keys()):
+            report["checked"] += 1
+            report["bytes"] += size
+            if actual is None:
+                report["unreadable"].append(path)
+            elif actual != expected[path]:
+                report["corrupt"].append({"path": path, "expected": expected[path], "actual": actual})
+                lg.warn(f"校验和不符: {path}")
+        save_state(batch[-1][0])
+        batch.clear()
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(rate,)) as pool:
+        for key, path in _walk(storage):
+            if key <= cursor:
+                continue
+            if is_checksum(path):
+                # 只记录了校验和，文件已经不在了
+                if not data_path(path).exists():
+                    report["missing"].append(str(data_path(path)))
+                    lg.warn(f"文件丢失: {data_path(path)}")
+                continue
+            if path.name.startswith('.'):
+                continue
+            digest = read_checksum(path)
+            if digest is None:
+                report["unexpected"].append(str(path))
+                continue
+            batch.append((key, path, digest))
+            if len(batch) >= jobs * _BATCH:
+                run_batch(pool)
+        if batch:
+            run_batch(pool)
+
+    report["finished"] = datetime.now().isoformat(timespec='seconds')
+    state.unlink(missing_ok=True)
+    return report
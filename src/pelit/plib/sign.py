@@ -0,0 +1,115 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+from typing import Any, Mapping
+from urllib.parse import urlencode
+
+class p_signer:
+    """
+    为文件地址生成和验证带过期时间的 HMAC 签名
+
+    第一个密钥用于签名，所有密钥都可用于验证，因此轮换时把新密钥放在最前面、
+    旧密钥保留到已签发的地址全部过期即可。地址中带有密钥的 ID，验证时只需一次 HMAC
+
+    Attributes:
+        _keys: [INTERNAL] 密钥 ID 到密钥的映射
+        _current: [INTERNAL] 用于签名的密钥 ID
+        _expires: [INTERNAL] 默认有效期（秒）
+    """
+    def __init__(self, keys: list[str], expires: int = 3600):
+        """
+        Args:
+            keys: 密钥列表，第一个用于签名
+            expires: 默认有效期（秒）
+        """
+        if not keys:
+            raise ValueError("至少需要一个签名密钥")
+        self._keys: dict[str, bytes] = {}
+        for key in keys:
+            self._keys[key_id(key)] = key.encode('utf-8')
+        self._current = key_id(keys[0])
+        self._expires = expires
+
+    def _digest(self, key: bytes, directory: str, file: str, expiry: int) -> str:
+        """
+        [INTERNAL] 计算签名，使用 URL 安全的 Base64
+        """
+        mac = hmac.new(key, f"{directory}/{file}\n{expiry}".encode('utf-8'), hashlib.sha256)
+        return base64.urlsafe_b64encode(mac.digest()).rstrip(b'=').decode('ascii')
+
+    def sign(self, directory: str, file: str, expires: int | None = None) -> str:
+        """
+        为文件生成签名参数
+
+        Args:
+            directory: 文件所在目录
+            file: 文件名
+            expires: 有效期（秒），默认使用配置文件中的值
+
+        Returns:
+            查询字符串，形如 e=<过期时间>&k=<密钥 ID>&s=<签名>
+        """
+        expiry = int(time.time()) + (expires or self._expires)
+        return urlencode({
+            "e": expiry,
+            "k": self._current,
+            "s": self._digest(self._keys[self._current], directory, file, expiry)
+        })
+
+    def verify(self, directory: str, file: str, args: Mapping[str, str]) -> bool:
+        """
+        验证请求中的签名参数
+
+        Args:
+            directory: 文件所在目录
+            file: 文件名
+            args: 请求的查询参数
+
+        Returns:
+            True 表示签名有效且未过期
+        """
+        key = self._keys.get(args.get('k', ''))
+        if key is None:
+            return False
+        try:
+            expiry = int(args.get('e', ''))
+        except ValueError:
+            return False
+        if expiry < time.time():
+            return False
+        # 按字节比较：compare_digest 遇到非 ASCII 的字符串会抛出 TypeError
+        signature = args.get('s', '').encode('utf-8')
+        return hmac.compare_digest(self._digest(key, directory, file, expiry).encode('ascii'), signature)
+
+def key_id(key: str) -> str:
+    """
+    密钥的 ID，出现在地址中，不泄露密钥本身
+
+    Args:
+        key: 密钥
+
+    Returns:
+        8 位 16 进制字符串
+    """
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:8]
+
+def create_signer(cfg: dict[str, Any]) -> p_signer | None:
+    """
+    根据配置文件创建签名器，可用 PELIT_SIGN_KEYS 环境变量（逗号分隔）或配置文件提供密钥
+
+    Args:
+        cfg: 配置文件中的 signing 部分
+
+    Returns:
+        签名器，没有可用的密钥时返回 None
+    """
+    keys: list[str] = []
+    if 'PELIT_SIGN_KEYS' in os.environ and cfg.get('from_env', False):
+        keys = [key.strip() for key in os.environ['PELIT_SIGN_KEYS'].split(',') if key.strip()]
+    elif 'keys' in cfg:
+        keys = cfg['keys']
+    if not keys:
+        return None
+    return p_signer(keys, cfg.get('expires', 3600))
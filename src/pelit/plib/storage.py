@@ -0,0 +1,194 @@
+import os
+import random
+import shutil
+import secrets
+import hashlib
+from abc import ABC, abstractmethod
+from typing import Any
+from pathlib import Path
+
+class p_storage(ABC):
+    """
+    存储后端的基类，路径只和它打交道，不直接拼接存储路径
+
+    Attributes:
+        roots: 所有存储根目录
+    """
+    roots: list[Path]
+
+    @abstractmethod
+    def locate(self, directory: str, file: str) -> Path:
+        """
+        找到文件应在的位置，不检查是否存在
+
+        Args:
+            directory: 文件所在目录
+            file: 文件名（含后缀）
+
+        Returns:
+            文件的完整路径
+        """
+
+    @abstractmethod
+    def allocate(self, directory: str, extension: str) -> Path:
+        """
+        为新文件分配一个不存在的路径，不创建目录
+
+        Args:
+            directory: 保存目录
+            extension: 后缀名，可以是空字符串
+
+        Returns:
+            新文件的完整路径
+        """
+
+    def list_dir(self, directory: str) -> list[str]:
+        """
+        列出目录下的文件和子目录，不包括隐藏文件
+
+        Args:
+            directory: 列举的目录，空字符串表示根目录
+
+        Returns:
+            名称列表；目录在所有根目录中都不存在时抛出 FileNotFoundError
+        """
+        names: set[str] = set()
+        found = False
+        for root in self.roots:
+            path = root / directory
+            if not path.is_dir():
+                continue
+            found = True
+            names.update(item.name for item in path.iterdir() if not item.name.startswith('.'))
+        if not found:
+            raise FileNotFoundError(directory)
+        return sorted(names)
+
+    def usage(self) -> int:
+        """
+        统计所有根目录中文件的总大小
+
+        Returns:
+            字节数
+        """
+        return sum(f.stat().st_size for root in self.roots
+                   for f in root.rglob('*') if f.is_file())
+
+    def health(self) -> list[dict[str, Any]]:
+        """
+        报告每个根目录的状态和磁盘用量
+
+        Returns:
+            每个根目录一项，包含 path、healthy、total、used、free（字节）
+        """
+        report: list[dict[str, Any]] = []
+        for root in self.roots:
+            item: dict[str, Any] = {"path": str(root), "healthy": is_healthy(root)}
+            try:
+                disk = shutil.disk_usage(root)
+                item.update(total=disk.total, used=disk.used, free=disk.free)
+            except OSError:
+                item.update(total=0, used=0, free=0)
+            report.append(item)
+        return report
+
+class p_local_storage(p_storage):
+    """
+    单一目录的存储，即 storage.path
+    """
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 存储目录
+        """
+        self.roots = [Path(path)]
+
+    def locate(self, directory: str, file: str) -> Path:
+        return self.roots[0] / directory / file
+
+    def allocate(self, directory: str, extension: str) -> Path:
+        while True:
+            path = self.roots[0] / directory / (secrets.token_hex(10) + extension)
+            if not path.exists():
+                return path
+
+class p_striped_storage(p_storage):
+    """
+    把文件分散到多个根目录（通常在不同磁盘上）
+
+    文件所在的根目录由文件名的散列唯一确定，读取时无需逐个探测；
+    写入时按剩余空间加权选择根目录，再生成一个散列恰好落在该根目录的文件名。
+    因此 roots 的顺序和数量在有数据后不能再改变
+
+    Attributes:
+        roots: 所有存储根目录，顺序决定文件位置
+    """
+    def __init__(self, roots: list[str]):
+        """
+        Args:
+            roots: 存储根目录列表
+        """
+        self.roots = [Path(root) for root in roots]
+
+    def _index(self, file: str) -> int:
+        """
+        [INTERNAL] 计算文件名对应的根目录序号
+        """
+        digest = hashlib.blake2b(file.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') % len(self.roots)
+
+    def locate(self, directory: str, file: str) -> Path:
+        return self.roots[self._index(file)] / directory / file
+
+    def allocate(self, directory: str, extension: str) -> Path:
+        candidates: list[int] = []
+        weights: list[int] = []
+        for i, root in enumerate(self.roots):
+            if not is_healthy(root):
+                continue
+            try:
+                free = shutil.disk_usage(root).free
+            except OSError:
+                continue
+            if free > 0:
+                candidates.append(i)
+                weights.append(free)
+        if not candidates:
+            raise OSError("没有可写入的存储根目录")
+
+        target = random.choices(candidates, weights=weights)[0]
+        while True:
+            file = secrets.token_hex(10) + extension
+            if self._index(file) != target:
+                continue
+            path = self.roots[target] / directory / file
+            if not path.exists():
+                return path
+
+def is_healthy(root: Path) -> bool:
+    """
+    检查根目录是否存在且可写
+
+    Args:
+        root: 根目录
+
+    Returns:
+        True 表示可用
+    """
+    return root.is_dir() and os.access(root, os.W_OK | os.X_OK)
+
+def create_storage(cfg: dict[str, Any]) -> p_storage:
+    """
+    根据配置文件创建存储后端
+
+    Args:
+        cfg: 配置文件中的 storage 部分
+
+    Returns:
+        存储后端
+    """
+    match cfg.get('backend', 'local'):
+        case 'striped':
+            return p_striped_storage(cfg['roots'])
+        case _:
+            return p_local_storage(cfg['path'])
@@ -0,0 +1,147 @@
+import os
+import time
+import atexit
+import random
+import threading
+import pstats
+import cProfile
+from typing import Any, Iterator
+from pathlib import Path
+from contextlib import contextmanager
+from flask import g, has_request_context, request, Response
+from pelit.plib.log import p_logger
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    记录请求中某个步骤的耗时，在请求之外或未启用计时时什么也不做
+
+    Args:
+        name: 步骤名，会出现在 Server-Timing 头中，只能包含字母、数字和下划线
+    """
+    if not has_request_context() or 'timings' not in g:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.timings.append((name, (time.perf_counter() - start) * 1000))
+
+class p_profiler:
+    """
+    请求计时和采样分析
+
+    每个请求的步骤耗时通过 Server-Timing 头返回，超过阈值时写入日志；
+    开启采样后每 N 个请求用 cProfile 分析一个，统计结果按进程汇总写入目录；
+    进程正常退出时（如 Gunicorn 按 max_requests 回收 worker）会写入剩余的结果
+
+    Attributes:
+        _lg: [INTERNAL] 日志
+        _slow: [INTERNAL] 慢请求阈值（毫秒），0 表示不记录
+        _sample: [INTERNAL] 采样间隔 N，0 表示不采样
+        _dir: [INTERNAL] 统计结果的保存目录
+        _dump_every: [INTERNAL] 每采样多少次写入一次统计结果
+        _stats: [INTERNAL] 当前进程汇总的统计结果
+        _count: [INTERNAL] 当前进程自上次写入后的采样次数
+        _lock: [INTERNAL] 保护汇总结果，适用于多线程 worker
+    """
+    def __init__(self, cfg: dict[str, Any], lg: p_logger):
+        """
+        Args:
+            cfg: 配置文件中的 profile 部分，可以为空
+            lg: 日志
+        """
+        self._lg = lg
+        self._slow: float = cfg.get('slow_ms', 0)
+        self._sample: int = cfg.get('sample', 0)
+        self._dir = Path(cfg.get('dir', '/tmp/pelit-profile'))
+        self._dump_every: int = cfg.get('dump_every', 10)
+        self._stats: pstats.Stats | None = None
+        self._count = 0
+        self._lock = threading.Lock()
+        if self._sample > 0:
+            # 注册在 fork 之前，worker 继承后各自在退出时写入自己的结果
+            atexit.register(self.flush)
+
+    def begin(self):
+        """
+        请求开始时调用，准备计时，按采样率启动 cProfile
+        """
+        g.timings = []
+        g.timing_start = time.perf_counter()
+        if self._sample > 0 and random.randrange(self._sample) == 0:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # 同一进程中已有其他线程在分析
+                return
+            g.profiler = profiler
+
+    def finish(self, response: Response) -> Response:
+        """
+        请求结束时调用，添加 Server-Timing 头，记录慢请求，汇总采样结果
+
+        Args:
+            response: 即将返回的响应
+
+        Returns:
+            添加了 Server-Timing 头的响应
+        """
+        if 'timings' not in g:
+            return response
+        total = (time.perf_counter() - g.timing_start) * 1000
+
+        profiler: cProfile.Profile | None = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            self._collect(profiler)
+
+        timings: list[tuple[str, float]] = g.timings
+        entries = [f"{name};dur={dur:.3f}" for name, dur in timings]
+        entries.append(f"total;dur={total:.3f}")
+        response.headers['Server-Timing'] = ', '.join(entries)
+
+        if self._slow > 0 and total > self._slow:
+            detail = ', '.join(f"{name}={dur:.1f}ms" for name, dur in timings)
+            self._lg.warn(f"{request.remote_addr} {request.method} {request.path} "
+                          f"慢请求 {total:.1f}ms: {detail}")
+        return response
+
+    def _collect(self, profiler: cProfile.Profile):
+        """
+        [INTERNAL] 汇总一次采样，每 dump_every 次写入一次
+        """
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profiler)
+            else:
+                self._stats.add(profiler)
+            self._count += 1
+            if self._count >= self._dump_every:
+                self._dump()
+
+    def flush(self):
+        """
+        写入尚未保存的采样结果，进程退出时自动调用
+        """
+        with self._lock:
+            if self._count > 0:
+                self._dump()
+
+    def _dump(self):
+        """
+        [INTERNAL] 写入 <dir>/pelit-<pid>.prof，调用时必须持有锁
+        """
+        if self._stats is None:
+            return
+        self._count = 0
+        try:
+            self._dir.mkdir(parents=True, exist_ok=True)
+            path = self._dir / f"pelit-{os.getpid()}.prof"
+            tmp = path.with_name(path.name + '.tmp')
+            self._stats.dump_stats(str(tmp))
+            os.replace(tmp, path)
+        except Exception as e:
+            self._lg.warn(f"写入分析结果失败: {e}")
@@ -1,10 +1,17 @@
-import re
-from flask import Blueprint, request, Response, jsonify, send_file
+import os
+from flask import Blueprint, request, Response, jsonify, send_file, g
 from typing import Any
 from pathlib import Path
 from pelit.plib.log import p_logger
+from pelit.plib.limit import p_limiter
+from pelit.plib.storage import create_storage
+from pelit.plib.timing import p_profiler, stage
+from pelit.plib.checksum import save_with_checksum, remove_checksum
+from pelit.plib.restore import restore_with_status, read_status, try_lock
+from pelit.plib.sign import create_signer
+from pelit.plib.replicate import p_replicator
 from pelit.plib.route_tool import *
-from multiprocessing import Process
+from multiprocessing import Process, get_context
 
 def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
     """
@@ -18,6 +25,70 @@ def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
     """
     main_route = Blueprint("main_route", __name__)
 
+    # 存储后端，路径通过它定位文件
+    storage = create_storage(cfg['storage'])
+
+    # 反盗链：referer 模式预先编译白名单，signed 模式验证 HMAC 签名，both 满足其一即可
+    hotlink_block: bool = cfg['network'].get('hotlink_block', False)
+    hotlink_mode: str = cfg['network'].get('hotlink_mode', 'referer')
+    whitelist = compile_whitelist(cfg['network'].get('hotlink_whitelist', []))
+    signer = create_signer(cfg.get('signing', {}))
+    if hotlink_block and hotlink_mode != 'referer' and signer is None:
+        lg.warn("反盗链使用签名模式，但没有配置签名密钥，签名地址将全部无效")
+
+    # 请求计时和采样分析，需在限速之前注册，以便计入限速检查
+    profiler = p_profiler(cfg.get('profile', {}), lg)
+    main_route.before_request(profiler.begin)
+    main_route.after_request(profiler.finish)
+
+    # 异步复制到镜像，复制线程在每个 worker 处理第一个请求时启动
+    replicator: p_replicator | None = None
+    if 'replication' in cfg:
+        replicator = p_replicator(cfg['replication'], storage, cfg['storage']['path'], lg)
+        main_route.before_request(replicator.ensure_started)
+
+    # 限速和并发限制，需在 fork 前创建以便各 worker 共享
+    if 'limit' in cfg:
+        limiter = p_limiter(cfg['limit'])
+
+        @main_route.before_request
+        def _limit() -> tuple[Response, int] | None:
+            """
+            检查客户端在当前路径上的令牌桶和并发数，超限时返回 429
+
+            Returns:
+                None 表示放行，否则为 JSON 格式的响应和状态码
+            """
+            if request.endpoint is None:
+                return None
+            name = request.endpoint.rsplit('.', 1)[-1].lstrip('_')
+            # 只有认证通过的密钥才能作为客户端标识，否则换一个请求头就能绕过限制
+            token = None
+            if limiter.by_token and authenticate(cfg):
+                token = request.headers.get("Authorization")
+            key = limiter.client_key(name, request.remote_addr, token)
+            with stage('limit'):
+                retry_after = limiter.acquire(name, key)
+            if retry_after > 0:
+                lg.info(f"{request.remote_addr} {request.method} {request.path} 429 请求过于频繁")
+                resp = jsonify({
+                    "success": False,
+                    "message": "请求过于频繁"
+                })
+                resp.headers['Retry-After'] = str(retry_after)
+                return resp, 429
+            g.limit_key = key
+            return None
+
+        @main_route.teardown_request
+        def _unlimit(_: BaseException | None) -> None:
+            """
+            请求结束后归还并发名额
+            """
+            key = g.pop('limit_key', None)
+            if key is not None:
+                limiter.release(key)
+
     @main_route.route('/upload/<directory>', methods=['POST'])
     def _upload(directory: str) -> tuple[Response, int]:
         """
@@ -31,7 +102,9 @@ def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
         """
         info_head = f"{request.remote_addr} {request.method} {request.path}"
 
-        if not authenticate(cfg):
+        with stage('authenticate'):
+            authorized = authenticate(cfg)
+        if not authorized:
             lg.warn(f"{info_head} 401: 认证失败")
             return jsonify({
                 "success": False,
@@ -54,7 +127,8 @@ def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
                 }), 400
 
         # 检查是否超过存储空间限制
-        size_warn: int = enough_space(cfg)
+        with stage('enough_space'):
+            size_warn: int = enough_space(cfg, storage)
         if size_warn == 2:
             lg.warn(f"{info_head} 502: 存储空间超限")
             return jsonify({
@@ -77,15 +151,24 @@ def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
         ext = Path(file.filename).suffix.lstrip('.')
         if not ext == '':
             ext = '.' + ext
-        # 保存目录
-        storage_path = Path(cfg['storage']['path'])
-        path = storage_path / directory
-        # 文件名，无后缀
-        name = generate_file_name(path, ext)
+        # 由存储后端分配保存路径
+        try:
+            with stage('allocate'):
+                file_path = storage.allocate(directory, ext)
+        except Exception as e:
+            lg.warn(f'{info_head} 502 没有可用的存储')
+            lg.warn(f'这是一个内部错误，请检查配置')
+            lg.warn(str(e))
+            return jsonify({
+                "success": False,
+                "message": "没有可用的存储"
+            }), 502
+        path = file_path.parent
 
         if not path.exists():
             try:
-                path.mkdir(parents=True, exist_ok=True)
+                with stage('mkdir'):
+                    path.mkdir(parents=True, exist_ok=True)
             except Exception as e:
                 lg.warn(f'{info_head} 502 创建目录失败: {path}')
                 lg.warn(f'这是一个内部错误，请检查配置')
@@ -97,15 +180,24 @@ def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
 
         # 尝试保存文件
         try:
-            file_path = path / (name + ext)
-            file.save(str(file_path))
-            url_path = Path(directory) / (name + ext)
+            with stage('save'):
+                digest = save_with_checksum(file.stream, file_path)
+            if replicator is not None:
+                try:
+                    with stage('journal'):
+                        replicator.record('put', directory, file_path.name)
+                except Exception as e:
+                    lg.warn(f"{info_head} 写入复制日志失败，镜像将缺少此文件: {e}")
+            url_path = Path(directory) / file_path.name
             resp: dict[str, Any] = {
                 "success": True,
                 "message": "保存成功",
                 "url": join_url(cfg['network']['base_url'] if 'base_url' in cfg['network'] else '', 
-                                 url_path.as_posix())
+                                 url_path.as_posix()),
+                "sha256": digest
             }
+            if signer is not None:
+                resp["signed_url"] = resp["url"] + '?' + signer.sign(directory, file_path.name)
             if size_warn == 1:
                 resp["warning"] = "存储空间已达警告值"
                 lg.warn(f"存储空间已达警告值")
@@ -135,7 +227,9 @@ def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
         """
         info_head = f"{request.remote_addr} {request.method} {request.path}"
 
-        if not authenticate(cfg):
+        with stage('authenticate'):
+            authorized = authenticate(cfg)
+        if not authorized:
             lg.warn(f"{info_head} 401: 认证失败")
             return jsonify({
                 "success": False,
@@ -149,9 +243,15 @@ def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
                 "message": "危险请求"
             }), 403
        
-        path = Path(cfg['storage']['path']) / directory / file
+        path = storage.locate(directory, file)
         try:
-            path.unlink()
+            # 先写入复制日志：写入失败时不删除，否则镜像会一直保留此文件
+            if replicator is not None:
+                with stage('journal'):
+                    replicator.record('delete', directory, file)
+            with stage('unlink'):
+                path.unlink()
+                remove_checksum(path)
             lg.info(f'{info_head} 200 删除成功')
             return jsonify({
                 "success": True,
@@ -186,7 +286,9 @@ def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
         """
         info_head = f"{request.remote_addr} {request.method} {request.path}"
 
-        if not authenticate(cfg):
+        with stage('authenticate'):
+            authorized = authenticate(cfg)
+        if not authorized:
             lg.warn(f"{info_head} 401: 认证失败")
             return jsonify({
                 "success": False,
@@ -198,11 +300,12 @@ def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
             return Response("禁止访问"), 403
 
         try:
-            path = Path(cfg['storage']['path']) / directory
+            with stage('list_dir'):
+                names = storage.list_dir(directory)
             resp: dict[str, Any] = {
                 "success": True,
                 "message": "",
-                "list": list_dir(path)
+                "list": names
             }
             lg.info(f'{info_head} 200 列举成功')
             return jsonify(resp), 200
@@ -241,45 +344,109 @@ def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
             lg.warn(f"{info_head} 403 危险请求")
             return Response("禁止访问"), 403
         
-        # 验证 Referer 请求头
-        referer =  request.headers.get("Referer")
-        if 'hotlink_block' in cfg['network']:
-            if cfg['network']['hotlink_block']:
-                if not referer or 'hotlink_whitelist' not in cfg['network']:
-                    lg.info(f"{info_head} 403 反盗链阻止")
-                    return Response("禁止外链"), 403
-                match = False
-                for rule in cfg['network']['hotlink_whitelist']:
-                    assert isinstance(rule, str)
-                    assert isinstance(referer, str)
-                    # 也允许直接匹配（忽略 . 在 RegEx 中的作用）
-                    if referer == rule:
-                        match = True
-                        break
-                    if re.fullmatch(rule, referer):
-                        match = True
-                        break
-                if not match:
-                    lg.info(f"{info_head} 403 反盗链阻止")
-                    return Response("禁止外链"), 403
-        
+        # 验证签名或 Referer 请求头
+        if hotlink_block:
+            with stage('hotlink'):
+                allowed = False
+                if hotlink_mode != 'referer' and signer is not None:
+                    allowed = signer.verify(directory, file, request.args)
+                if not allowed and hotlink_mode != 'signed':
+                    allowed = referer_allowed(request.headers.get("Referer"), whitelist)
+            if not allowed:
+                lg.info(f"{info_head} 403 反盗链阻止")
+                return Response("禁止外链"), 403
+
         # 禁止访问隐藏的文件
         if directory.startswith('.') or file.startswith('.'):
             return Response("禁止访问"), 403
 
         # 返回文件
-        f_path = Path(cfg['storage']['path']) / directory / file
-        if not f_path.exists():
+        f_path = storage.locate(directory, file)
+        try:
+            found = f_path.exists()
+        except OSError:
+            found = False
+        # 主存储根目录不可用时从镜像读取
+        if not found and replicator is not None:
+            mirror_path = replicator.fallback(directory, file)
+            if mirror_path is not None:
+                lg.warn(f"{info_head} 主存储不可用，从镜像读取")
+                f_path, found = mirror_path, True
+        if not found:
             return Response("未找到文件"), 404
         try:
+            with stage('send_file'):
+                resp = send_file(str(f_path))
             lg.info(f"{info_head} 200")
-            return send_file(str(f_path)), 200
+            return resp, 200
         except Exception as e:
             lg.warn(f"{info_head} 502 发送文件失败")
             lg.warn(f"这是一个内部错误，请检查配置")
             lg.warn(f"{e}")
             return Response("内部错误"), 502
 
+    @main_route.route('/sign/<directory>/<file>', methods=['GET'])
+    def _sign(directory: str, file: str) -> tuple[Response, int]:
+        """
+        为已有文件生成带签名的地址，可用 ?expires=<秒> 指定有效期
+
+        Args:
+            directory: 文件所在目录
+            file: 文件名
+
+        Returns:
+            JSON 格式的签名地址和响应码
+        """
+        info_head = f"{request.remote_addr} {request.method} {request.path}"
+
+        with stage('authenticate'):
+            authorized = authenticate(cfg)
+        if not authorized:
+            lg.warn(f"{info_head} 401: 认证失败")
+            return jsonify({
+                "success": False,
+                "message": "认证失败"
+            }), 401
+
+        if is_attempting_traversal(directory) or is_attempting_traversal(file):
+            lg.warn(f"{info_head} 403 危险请求")
+            return jsonify({
+                "success": False,
+                "message": "危险请求"
+            }), 403
+
+        if signer is None:
+            lg.warn(f"{info_head} 502 未配置签名密钥")
+            return jsonify({
+                "success": False,
+                "message": "未配置签名密钥"
+            }), 502
+
+        expires = request.args.get('expires', type=int)
+        if expires is not None and expires <= 0:
+            lg.warn(f"{info_head} 400 无效的有效期")
+            return jsonify({
+                "success": False,
+                "message": "无效的有效期"
+            }), 400
+
+        if not storage.locate(directory, file).exists():
+            lg.info(f"{info_head} 404 未找到文件")
+            return jsonify({
+                "success": False,
+                "message": "没有找到文件"
+            }), 404
+
+        url_path = Path(directory) / file
+        url = join_url(cfg['network']['base_url'] if 'base_url' in cfg['network'] else '',
+                       url_path.as_posix())
+        lg.info(f"{info_head} 200 签名成功")
+        return jsonify({
+            "success": True,
+            "message": "",
+            "url": url + '?' + signer.sign(directory, file, expires)
+        }), 200
+
     @main_route.route('/backup', methods=['GET'])
     @main_route.route('/backup/<directory>', methods=['GET'])
     def _backup(directory: str = '') -> tuple[Response, int]:
@@ -291,26 +458,30 @@ def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
         """
         info_head = f"{request.remote_addr} {request.method} {request.path}"
 
-        if not authenticate(cfg):
+        with stage('authenticate'):
+            authorized = authenticate(cfg)
+        if not authorized:
             lg.warn(f"{info_head} 401: 认证失败")
             return jsonify({
                 "success": False,
                 "message": "认证失败"
             }), 401
 
-        bak_name = generate_file_name(Path(cfg['storage']['path']), '.tar.gz')
+        with stage('generate_file_name'):
+            bak_name = generate_file_name(Path(cfg['storage']['path']), '.tar.gz')
         bak_path = Path(cfg['storage']['path']) / bak_name
         bak_url = join_url(
             cfg['network']['base_url'] if 'network' in cfg['network'] else '',
             bak_name + '.tar.gz')
 
-        path = Path(cfg['storage']['path']) / directory
+        paths = [root / directory for root in storage.roots]
 
         # 创建新进程压缩备份
         # FIXME: 由于是多进程的，这个任务失败了也不会有表示
         # FIXME: 备份会包括所有之前所有的 .tar.gz
-        p = Process(target=backup_to_file, args=(path, bak_path))
-        p.start()
+        with stage('spawn'):
+            p = Process(target=backup_to_file, args=(paths, bak_path))
+            p.start()
 
         lg.info(f"{info_head} 200 备份任务创建成功")
         lg.info(f"位置：{bak_path}.tar.gz")
@@ -320,4 +491,139 @@ def create_route(cfg: dict[str, Any], lg: p_logger) -> Blueprint:
             "message": "备份任务创建成功"
         }), 200
 
+    @main_route.route('/restore', methods=['GET'])
+    def _restore_status() -> tuple[Response, int]:
+        """
+        查询最近一次恢复任务的状态和进度
+
+        Returns:
+            JSON 格式的状态和响应码
+        """
+        info_head = f"{request.remote_addr} {request.method} {request.path}"
+
+        with stage('authenticate'):
+            authorized = authenticate(cfg)
+        if not authorized:
+            lg.warn(f"{info_head} 401: 认证失败")
+            return jsonify({
+                "success": False,
+                "message": "认证失败"
+            }), 401
+
+        state = read_status(Path(cfg['storage']['path']) / '.pelit-restore.json')
+        if state is None:
+            lg.info(f"{info_head} 404 没有恢复任务")
+            return jsonify({
+                "success": False,
+                "message": "没有恢复任务"
+            }), 404
+        lg.info(f"{info_head} 200 查询成功")
+        return jsonify({
+            "success": True,
+            "message": "",
+            "status": state
+        }), 200
+
+    @main_route.route('/restore/<archive>', methods=['POST'])
+    @main_route.route('/restore/<archive>/<directory>', methods=['POST'])
+    def _restore(archive: str, directory: str = '') -> tuple[Response, int]:
+        """
+        创建一个恢复任务，从 storage.path 下的备份归档恢复
+
+        Args:
+            archive: 备份归档的文件名，即 /backup 返回的文件名
+            directory: 目录备份需要指定恢复到的目录，完整备份不指定
+
+        Returns:
+            包含响应和状态码
+        """
+        info_head = f"{request.remote_addr} {request.method} {request.path}"
+
+        with stage('authenticate'):
+            authorized = authenticate(cfg)
+        if not authorized:
+            lg.warn(f"{info_head} 401: 认证失败")
+            return jsonify({
+                "success": False,
+                "message": "认证失败"
+            }), 401
+
+        if is_attempting_traversal(archive) or is_attempting_traversal(directory) \
+                or archive.startswith('.') or directory.startswith('.'):
+            lg.warn(f"{info_head} 403 危险请求")
+            return jsonify({
+                "success": False,
+                "message": "危险请求"
+            }), 403
+
+        archive_path = Path(cfg['storage']['path']) / archive
+        if not archive_path.is_file():
+            lg.info(f"{info_head} 404 未找到备份")
+            return jsonify({
+                "success": False,
+                "message": "未找到备份"
+            }), 404
+
+        # 同一时间只允许一个恢复任务，先取得锁再创建进程
+        status_path = Path(cfg['storage']['path']) / '.pelit-restore.json'
+        lock = try_lock(Path(cfg['storage']['path']) / '.pelit-restore.lock')
+        if lock is None:
+            lg.warn(f"{info_head} 409 已有恢复任务")
+            return jsonify({
+                "success": False,
+                "message": "已有恢复任务正在进行"
+            }), 409
+
+        # 创建新进程恢复，进度通过 GET /restore 查询；
+        # 必须用 fork，恢复进程继承锁的描述符，退出时才释放
+        try:
+            with stage('spawn'):
+                p = get_context('fork').Process(target=restore_with_status,
+                                                args=(storage, archive_path, directory, status_path,
+                                                      replicator))
+                p.start()
+        finally:
+            os.close(lock)
+
+        lg.info(f"{info_head} 200 恢复任务创建成功")
+        return jsonify({
+            "success": True,
+            "message": "恢复任务创建成功"
+        }), 200
+
+    @main_route.route('/storage', methods=['GET'])
+    def _storage() -> tuple[Response, int]:
+        """
+        报告每个存储根目录的状态和用量
+
+        Returns:
+            JSON 格式的报告和响应码
+        """
+        info_head = f"{request.remote_addr} {request.method} {request.path}"
+
+        with stage('authenticate'):
+            authorized = authenticate(cfg)
+        if not authorized:
+            lg.warn(f"{info_head} 401: 认证失败")
+            return jsonify({
+                "success": False,
+                "message": "认证失败"
+            }), 401
+
+        with stage('health'):
+            roots = storage.health()
+        for root in roots:
+            if not root['healthy']:
+                lg.warn(f"存储根目录不可用: {root['path']}")
+        resp: dict[str, Any] = {
+            "success": True,
+            "message": "",
+            "roots": roots
+        }
+        if replicator is not None:
+            with stage('replication'):
+                resp["replication"] = replicator.status()
+        lg.info(f'{info_head} 200 查询成功')
+        return jsonify(resp), 200
+
     return main_route
@@ -0,0 +1,19 @@
+import pytest
+from pelit.plib.arg import parse_arguments
+from pelit.plib.result import Ok, Err
+
+def test_config_from_environment(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("PELIT_CONFIG", "/config/pelit.toml")
+    cmd = parse_arguments(["app", "scrub", "-j", "2"])
+    assert isinstance(cmd, Ok)
+    assert cmd.value["scrub"] and cmd.value["config_path"] == "/config/pelit.toml"
+
+def test_config_option_overrides_environment(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("PELIT_CONFIG", "/config/pelit.toml")
+    cmd = parse_arguments(["app", "restore", "-c", "other.toml", "-i", "backup.tar.gz"])
+    assert isinstance(cmd, Ok)
+    assert cmd.value["restore"] and cmd.value["config_path"] == "other.toml"
+
+def test_config_required(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.delenv("PELIT_CONFIG", raising=False)
+    assert isinstance(parse_arguments(["app", "check"]), Err)
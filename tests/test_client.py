@@ -0,0 +1,100 @@
+import json
+import time
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pelit.client import p_client
+from pelit.plib.result import Ok, Err
+
+class Handler(BaseHTTPRequestHandler):
+    # 依次返回的状态码，用完后返回 200
+    statuses: list[int] = []
+    hits = 0
+
+    def reply(self):
+        Handler.hits += 1
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status = Handler.statuses.pop(0) if Handler.statuses else 200
+        body = json.dumps({"url": "http://x/img/a.png", "list": []}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = reply
+
+    def log_message(self, *args):
+        pass
+
+class KeepAliveHandler(Handler):
+    # 长连接，空闲 0.5 秒后由服务器关闭
+    protocol_version = 'HTTP/1.1'
+    timeout = 0.5
+
+    def send_response(self, code: int, message: str | None = None):
+        super().send_response(code, message)
+        if code == 429:
+            self.send_header('Retry-After', '1')
+
+def serve(statuses: list[int], handler: type[Handler] = Handler) -> tuple[ThreadingHTTPServer, p_client]:
+    Handler.statuses = list(statuses)
+    Handler.hits = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, p_client(f"http://127.0.0.1:{server.server_port}", "key", retries=3)
+
+def test_upload_does_not_retry_server_errors(tmp_path: Path):
+    file = tmp_path / "a.png"
+    file.write_bytes(b"data")
+    server, client = serve([500])
+    try:
+        assert isinstance(client.upload(file, "img"), Err)
+        assert Handler.hits == 1
+    finally:
+        server.shutdown()
+
+def test_upload_retries_when_not_processed(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda _: None)
+    file = tmp_path / "a.png"
+    file.write_bytes(b"data")
+    server, client = serve([429, 503])
+    try:
+        result = client.upload(file, "img")
+        assert isinstance(result, Ok) and result.value == "http://x/img/a.png"
+        assert Handler.hits == 3
+    finally:
+        server.shutdown()
+
+def test_list_retries_server_errors(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda _: None)
+    server, client = serve([502])
+    try:
+        assert isinstance(client.list("img"), Ok)
+        assert Handler.hits == 2
+    finally:
+        server.shutdown()
+
+def test_upload_reconnects_after_idle_close(tmp_path: Path):
+    file = tmp_path / "a.png"
+    file.write_bytes(b"data")
+    server, client = serve([], KeepAliveHandler)
+    try:
+        assert isinstance(client.upload(file, "img"), Ok)
+        # 服务器已关闭空闲连接，复用时发送失败，请求没有被处理，应重新连接
+        time.sleep(1)
+        assert isinstance(client.upload(file, "img"), Ok)
+        assert Handler.hits == 2
+    finally:
+        server.shutdown()
+
+def test_upload_retries_429_with_keep_alive(tmp_path: Path):
+    file = tmp_path / "a.png"
+    file.write_bytes(b"data")
+    server, client = serve([429], KeepAliveHandler)
+    try:
+        # Retry-After 比服务器的空闲超时长
+        assert isinstance(client.upload(file, "img"), Ok)
+        assert Handler.hits == 2
+    finally:
+        server.shutdown()
@@ -0,0 +1,148 @@
+import sys
+import pytest
+from pathlib import Path
+from flask import Flask
+from pelit.plib import limit as limit_module
+from pelit.plib.limit import p_limiter
+from pelit.plib.log import p_logger
+from pelit.route import create_route
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(limit_module.time, "monotonic", clock)
+    return clock
+
+def hit(limiter: p_limiter, route: str, key: int) -> int:
+    retry_after = limiter.acquire(route, key)
+    if retry_after == 0:
+        limiter.release(key)
+    return retry_after
+
+def test_refill_and_burst(clock: Clock):
+    limiter = p_limiter({"routes": {"list": {"rate": 1, "burst": 3}}})
+    assert [hit(limiter, "list", 1) for _ in range(4)] == [0, 0, 0, 1]
+    clock.now += 1
+    assert hit(limiter, "list", 1) == 0
+    assert hit(limiter, "list", 1) == 1
+    # 桶容量不会超过 burst
+    clock.now += 100
+    assert [hit(limiter, "list", 1) for _ in range(4)] == [0, 0, 0, 1]
+    # 不同客户端互不影响
+    assert hit(limiter, "list", 2) == 0
+
+def test_retry_after(clock: Clock):
+    limiter = p_limiter({"routes": {"upload": {"rate": 0.1, "burst": 1}}})
+    assert hit(limiter, "upload", 1) == 0
+    assert hit(limiter, "upload", 1) == 10
+    clock.now += 4
+    assert hit(limiter, "upload", 1) == 6
+
+def test_concurrency(clock: Clock):
+    limiter = p_limiter({"default": {"concurrency": 2}})
+    assert limiter.acquire("list", 1) == 0
+    assert limiter.acquire("list", 1) == 0
+    assert limiter.acquire("list", 1) == 1
+    limiter.release(1)
+    assert limiter.acquire("list", 1) == 0
+    # 进行中的请求超过 stale 秒后视为已结束（worker 被杀死）
+    clock.now += 61
+    assert limiter.acquire("list", 1) == 0
+
+def test_backup_default_is_strict(clock: Clock):
+    limiter = p_limiter({})
+    assert hit(limiter, "list", 1) == 0 and hit(limiter, "list", 1) == 0
+    assert hit(limiter, "backup", 1) == 0
+    assert hit(limiter, "backup", 1) == 60
+    # 进行中的备份占用唯一的并发名额
+    clock.now += 120
+    assert limiter.acquire("backup", 1) == 0
+    clock.now += 30
+    assert limiter.acquire("backup", 1) == 1
+
+def test_client_key():
+    by_ip = p_limiter({})
+    by_token = p_limiter({"key": "token"})
+    assert by_ip.client_key("list", "1.2.3.4", "secret") == by_ip.client_key("list", "1.2.3.4", None)
+    assert by_token.client_key("list", "1.2.3.4", None) == by_ip.client_key("list", "1.2.3.4", None)
+    assert by_token.client_key("list", "1.2.3.4", "a") != by_token.client_key("list", "1.2.3.4", "b")
+    assert by_token.client_key("list", "1.2.3.4", "a") == by_token.client_key("list", "5.6.7.8", "a")
+    assert by_ip.client_key("list", "1.2.3.4", None) != by_ip.client_key("upload", "1.2.3.4", None)
+
+def make_client(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, limit: dict):
+    monkeypatch.setenv("PELIT_AUTH", "secret")
+    cfg = {
+        "version": "0.1.0",
+        "network": {"base_url": "http://x"},
+        "storage": {"path": str(tmp_path)},
+        "auth": {"from_env": True},
+        "limit": limit
+    }
+    app = Flask(__name__)
+    app.register_blueprint(create_route(cfg, p_logger(2)))
+    return app.test_client()
+
+def test_route_429(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    client = make_client(tmp_path, monkeypatch, {"routes": {"list": {"rate": 0.5, "burst": 1}}})
+    headers = {"Authorization": "secret"}
+    assert client.get("/list", headers=headers).status_code == 200
+    resp = client.get("/list", headers=headers)
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "2"
+    # 其他路径不受影响
+    assert client.get("/storage", headers=headers).status_code == 200
+
+def test_route_releases_concurrency(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    client = make_client(tmp_path, monkeypatch, {"default": {"concurrency": 1}})
+    headers = {"Authorization": "secret"}
+    # 每个请求结束时在 teardown_request 中归还名额，失败的请求也一样
+    for _ in range(3):
+        assert client.get("/list", headers=headers).status_code == 200
+        assert client.get("/list/missing", headers=headers).status_code == 404
+
+def test_route_token_requires_authentication(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    client = make_client(tmp_path, monkeypatch,
+                         {"key": "token", "routes": {"list": {"rate": 0.5, "burst": 1}}})
+    # 未认证的请求按 IP 计数，换一个 Authorization 头也绕不过去
+    assert client.get("/list", headers={"Authorization": "guess-1"}).status_code == 401
+    assert client.get("/list", headers={"Authorization": "guess-2"}).status_code == 429
+    # 认证通过的请求有自己的限额
+    assert client.get("/list", headers={"Authorization": "secret"}).status_code == 200
+    assert client.get("/list", headers={"Authorization": "secret"}).status_code == 429
+
+def test_proxy_hops(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    config = tmp_path / "pelit.toml"
+    config.write_text(f"""
+version = "0.1.0"
+[network]
+base_url = "http://x"
+[storage]
+path = "{tmp_path}"
+[auth]
+from_env = true
+[limit]
+proxy_hops = 1
+[limit.routes.list]
+rate = 0.5
+burst = 1
+""")
+    monkeypatch.setenv("PELIT_AUTH", "secret")
+    monkeypatch.setattr(sys, "argv", ["app", "run", "-c", str(config), "-v", "2"])
+    from pelit.app import create_app
+    client = create_app().test_client()
+
+    def get(addr: str) -> int:
+        return client.get("/list", headers={"Authorization": "secret", "X-Forwarded-For": addr},
+                          environ_base={"REMOTE_ADDR": "10.0.0.1"}).status_code
+
+    # 经过同一个代理的不同客户端分别计数
+    assert get("1.1.1.1") == 200
+    assert get("2.2.2.2") == 200
+    assert get("1.1.1.1") == 429
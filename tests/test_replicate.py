@@ -0,0 +1,207 @@
+import io
+import os
+import sys
+import json
+import time
+import signal
+import subprocess
+import pytest
+from pathlib import Path
+from pelit.plib.log import p_logger
+from pelit.plib.storage import p_local_storage
+from pelit.plib.checksum import save_with_checksum, checksum_path
+from pelit.plib.replicate import p_replicator
+from pelit.plib.restore import restore_with_status
+from pelit.plib.route_tool import backup_to_file
+from pelit.plib import replicate as replicate_module
+
+@pytest.fixture
+def setup(tmp_path: Path) -> tuple[p_local_storage, p_replicator, Path]:
+    data = tmp_path / "data"
+    mirror = tmp_path / "mirror"
+    data.mkdir()
+    mirror.mkdir()
+    storage = p_local_storage(str(data))
+    # 日志放在主存储之外，主存储损坏后仍可读取
+    replicator = p_replicator({"mirrors": [str(mirror)], "journal": str(tmp_path / "journal")},
+                              storage, str(data), p_logger(0))
+    return storage, replicator, mirror
+
+def put(storage: p_local_storage, replicator: p_replicator, directory: str, file: str, data: bytes):
+    path = storage.locate(directory, file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    save_with_checksum(io.BytesIO(data), path)
+    replicator.record('put', directory, file)
+
+def drain(replicator: p_replicator) -> int:
+    """
+    应用所有事件并清空日志，相当于复制线程的一轮
+    """
+    events, offset = replicator._pending(replicator._read_offset(), 1000)
+    replicator._apply(events)
+    replicator._write_offset(offset)
+    return replicator._compact(offset)
+
+def test_journal_and_apply(setup):
+    storage, replicator, mirror = setup
+    put(storage, replicator, "img", "a.png", b"a")
+    put(storage, replicator, "img", "b.png", b"b")
+    replicator.record('delete', "img", "b.png")
+    storage.locate("img", "b.png").unlink()
+
+    events, offset = replicator._pending(0, 1000)
+    assert [(e['op'], e['file']) for e in events] == [('put', 'a.png'), ('put', 'b.png'), ('delete', 'b.png')]
+    assert offset == replicator._journal.stat().st_size
+
+    assert drain(replicator) == 0
+    assert (mirror / "img" / "a.png").read_bytes() == b"a"
+    assert checksum_path(mirror / "img" / "a.png").exists()
+    assert not (mirror / "img" / "b.png").exists()
+    assert replicator.status()["pending"] == 0
+
+def test_partial_line_not_applied(setup):
+    storage, replicator, _ = setup
+    put(storage, replicator, "img", "a.png", b"a")
+    with open(replicator._journal, 'ab') as f:
+        f.write(b'{"t": 0, "op": "put"')
+    events, offset = replicator._pending(0, 1000)
+    assert len(events) == 1
+    # 还有未写完的事件，不能清空日志
+    assert replicator._compact(offset) == offset
+    assert replicator._journal.stat().st_size > offset
+
+def test_compact_saves_offset_before_truncating(setup, monkeypatch: pytest.MonkeyPatch):
+    storage, replicator, _ = setup
+    put(storage, replicator, "img", "a.png", b"a")
+    events, offset = replicator._pending(0, 1000)
+    replicator._apply(events)
+    replicator._write_offset(offset)
+
+    def crash(fd: int, length: int):
+        raise OSError("中断")
+    monkeypatch.setattr(replicate_module.os, "ftruncate", crash)
+    with pytest.raises(OSError):
+        replicator._compact(offset)
+    # 在清空日志前中断：位置已归零，重启后重复应用而不是跳过事件
+    assert replicator._read_offset() == 0
+    assert replicator._journal.stat().st_size == offset
+
+def test_offset_beyond_journal_restarts(setup):
+    storage, replicator, _ = setup
+    put(storage, replicator, "img", "a.png", b"a")
+    events, _ = replicator._pending(10 ** 6, 1000)
+    assert len(events) == 1
+
+def test_fallback_only_when_primary_unhealthy(setup, tmp_path: Path):
+    storage, replicator, mirror = setup
+    put(storage, replicator, "img", "a.png", b"a")
+    drain(replicator)
+    storage.locate("img", "a.png").unlink()
+
+    # 主存储可用：文件缺失即已删除，不从镜像读取
+    assert replicator.fallback("img", "a.png") is None
+
+    os.rename(tmp_path / "data", tmp_path / "broken")
+    assert replicator.fallback("img", "a.png") == mirror / "img" / "a.png"
+    assert replicator.fallback("img", "missing.png") is None
+
+def test_fallback_respects_pending_delete(setup, tmp_path: Path):
+    storage, replicator, mirror = setup
+    put(storage, replicator, "img", "a.png", b"a")
+    drain(replicator)
+    replicator.record('delete', "img", "a.png")
+    # 删除尚未复制时主存储损坏
+    os.rename(tmp_path / "data", tmp_path / "broken")
+
+    assert (mirror / "img" / "a.png").exists()
+    assert replicator.fallback("img", "a.png") is None
+
+def test_sync_directory(setup):
+    storage, replicator, mirror = setup
+    put(storage, replicator, "img", "a.png", b"a")
+    put(storage, replicator, "img", "b.png", b"b")
+    drain(replicator)
+
+    # 模拟恢复：目录被整体替换，b.png 不在归档中
+    storage.locate("img", "b.png").unlink()
+    checksum_path(storage.locate("img", "b.png")).unlink()
+    storage.locate("img", "a.png").write_bytes(b"restored")
+    storage.locate("img", "c.png").write_bytes(b"c")
+    replicator.record('sync', "img", "")
+    drain(replicator)
+
+    assert sorted(os.listdir(mirror / "img")) == [".a.png.sha256", "a.png", "c.png"]
+    assert (mirror / "img" / "a.png").read_bytes() == b"restored"
+
+def test_restore_records_sync(setup, tmp_path: Path):
+    storage, replicator, mirror = setup
+    put(storage, replicator, "img", "a.png", b"a")
+    put(storage, replicator, "img", "b.png", b"b")
+    drain(replicator)
+    backup_to_file([storage.roots[0] / "img"], tmp_path / "img")
+    put(storage, replicator, "img", "c.png", b"c")
+    drain(replicator)
+
+    status = tmp_path / "restore.json"
+    restore_with_status(storage, tmp_path / "img.tar.gz", "img", status, replicator)
+    assert json.loads(status.read_text())["state"] == "done"
+    drain(replicator)
+
+    assert sorted(os.listdir(mirror / "img")) == [".a.png.sha256", ".b.png.sha256", "a.png", "b.png"]
+
+def test_fallback_index_after_compaction(setup, tmp_path: Path):
+    storage, replicator, mirror = setup
+    put(storage, replicator, "img", "a.png", b"a")
+    drain(replicator)
+    replicator.record('sync', "img", "")
+    os.rename(tmp_path / "data", tmp_path / "broken")
+    # 目录的同步还没有应用，镜像中的内容可能已过时
+    assert replicator.fallback("img", "a.png") is None
+
+    os.rename(tmp_path / "broken", tmp_path / "data")
+    assert drain(replicator) == 0
+    # 日志清空后重新写入，长度超过之前读取的位置
+    for i in range(5):
+        replicator.record('put', "doc", f"{i}.txt")
+    os.rename(tmp_path / "data", tmp_path / "broken")
+    assert replicator.fallback("img", "a.png") == mirror / "img" / "a.png"
+
+def test_put_waits_for_unhealthy_root(setup, tmp_path: Path):
+    storage, replicator, mirror = setup
+    put(storage, replicator, "img", "a.png", b"a")
+    os.rename(tmp_path / "data", tmp_path / "broken")
+    events, _ = replicator._pending(0, 1000)
+    # 根目录不可用时不能把 put 当作已删除而丢弃
+    with pytest.raises(OSError):
+        replicator._apply(events)
+
+    os.rename(tmp_path / "broken", tmp_path / "data")
+    drain(replicator)
+    assert (mirror / "img" / "a.png").read_bytes() == b"a"
+
+def test_leader_lock_not_inherited(setup):
+    _, replicator, _ = setup
+    lock = open(replicator._leader, 'ab')
+    assert replicator._lead(lock)
+
+    # fork 出的子进程（如恢复任务）持有描述符的副本，但不持有锁
+    pid = os.fork()
+    if pid == 0:
+        time.sleep(2)
+        os._exit(0)
+    try:
+        lock.close()
+        # 另一个 worker 可以接替
+        script = f"""
+from pelit.plib.log import p_logger
+from pelit.plib.storage import p_local_storage
+from pelit.plib.replicate import p_replicator
+r = p_replicator({{"mirrors": [], "journal": {str(replicator._journal)!r}}},
+                 p_local_storage("/"), "/", p_logger(2))
+assert r._lead(open(r._leader, 'ab'))
+"""
+        src = Path(__file__).parents[1] / "src"
+        subprocess.run([sys.executable, "-c", script], check=True, env={"PYTHONPATH": str(src)})
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
@@ -0,0 +1,113 @@
+import io
+import os
+import shutil
+import tarfile
+import pytest
+from pathlib import Path
+from pelit.plib.result import Ok, Err
+from pelit.plib.storage import p_local_storage, p_striped_storage
+from pelit.plib.checksum import save_with_checksum, read_checksum
+from pelit.plib.route_tool import backup_to_file
+from pelit.plib.restore import restore_from_file, try_lock, _split
+
+def make_archive(path: Path, entries: dict[str, bytes]) -> Path:
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, data in entries.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+def test_split():
+    assert _split("img/a.png", "") == ("img", "a.png")
+    assert _split("a.png", "img") == ("img", "a.png")
+    assert _split(".a.png.sha256", "img") == ("img", ".a.png.sha256")
+    assert _split("a.tar.gz", "") is None
+    assert _split(".pelit-restore-0123/.old/img/a.png", "") is None
+    assert _split("img/sub/a.png", "") is False
+    assert _split("../a.png", "img") is False
+    assert _split("/img/a.png", "") is False
+
+def test_roundtrip_striped(tmp_path: Path):
+    roots = [tmp_path / "d0", tmp_path / "d1"]
+    for root in roots:
+        root.mkdir()
+    storage = p_striped_storage([str(root) for root in roots])
+    names = []
+    for i in range(20):
+        path = storage.allocate("img", ".png")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        save_with_checksum(io.BytesIO(f"file {i}".encode()), path)
+        names.append(path.name)
+    # 恢复的临时目录不能被打包
+    (roots[0] / ".pelit-restore-0123" / ".old" / "img").mkdir(parents=True)
+    (roots[0] / ".pelit-restore-0123" / ".old" / "img" / "x.png").write_bytes(b"x")
+    backup_to_file(roots, roots[0] / "backup")
+    archive = roots[0] / "backup.tar.gz"
+    with tarfile.open(archive) as tar:
+        assert not any(".pelit-restore-" in name for name in tar.getnames())
+    shutil.rmtree(roots[0] / ".pelit-restore-0123")
+
+    for path in [storage.locate("img", name) for name in names[:5]]:
+        path.unlink()
+    result = restore_from_file(storage, archive, jobs=2)
+    assert isinstance(result, Ok)
+    assert result.value["directories"] == ["img"]
+    assert result.value["files"] == 40
+    for name in names:
+        path = storage.locate("img", name)
+        assert read_checksum(path) is not None and path.exists()
+    # 临时目录已清理，被替换的目录保留
+    leftover = [p for root in roots for p in root.iterdir() if p.name.startswith(".pelit-restore-")]
+    assert sorted(map(str, leftover)) == sorted(result.value["previous"])
+    assert all(p.name.startswith(".pelit-restore-old-") for p in leftover)
+
+def test_directory_archive_needs_directory(tmp_path: Path):
+    storage = p_local_storage(str(tmp_path / "data"))
+    (tmp_path / "data").mkdir()
+    archive = make_archive(tmp_path / "img.tar.gz", {"a.png": b"a", "b.png": b"b"})
+
+    assert isinstance(restore_from_file(storage, archive), Err)
+    result = restore_from_file(storage, archive, "img")
+    assert isinstance(result, Ok) and result.value["files"] == 2
+    assert (tmp_path / "data" / "img" / "a.png").read_bytes() == b"a"
+
+def test_checksum_mismatch(tmp_path: Path):
+    storage = p_local_storage(str(tmp_path / "data"))
+    (tmp_path / "data" / "img").mkdir(parents=True)
+    (tmp_path / "data" / "img" / "old.png").write_bytes(b"old")
+    archive = make_archive(tmp_path / "bad.tar.gz", {
+        "img/a.png": b"a",
+        "img/.a.png.sha256": b"0" * 64,
+    })
+
+    assert isinstance(restore_from_file(storage, archive), Err)
+    # 失败时不改动现有目录
+    assert os.listdir(tmp_path / "data" / "img") == ["old.png"]
+    assert os.listdir(tmp_path / "data") == ["img"]
+
+def test_lock_is_exclusive(tmp_path: Path):
+    lock = tmp_path / ".pelit-restore.lock"
+    fd = try_lock(lock)
+    assert fd is not None
+    assert try_lock(lock) is None
+    os.close(fd)
+    fd = try_lock(lock)
+    assert fd is not None
+    os.close(fd)
+
+def test_replaced_directory_is_kept(tmp_path: Path):
+    data = tmp_path / "data"
+    (data / "img").mkdir(parents=True)
+    (data / "img" / "a.png").write_bytes(b"a")
+    backup_to_file([data / "img"], tmp_path / "img")
+    # 备份之后上传的文件
+    (data / "img" / "late.png").write_bytes(b"late")
+
+    result = restore_from_file(p_local_storage(str(data)), tmp_path / "img.tar.gz", "img")
+    assert isinstance(result, Ok)
+    assert os.listdir(data / "img") == ["a.png"]
+    [previous] = result.value["previous"]
+    assert (Path(previous) / "img" / "late.png").read_bytes() == b"late"
+    # 保留的目录不会被当作上传的目录，也不会再被备份
+    assert p_local_storage(str(data)).list_dir("") == ["img"]
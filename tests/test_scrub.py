@@ -0,0 +1,56 @@
+import io
+import json
+import pytest
+from pathlib import Path
+from pelit.plib.log import p_logger
+from pelit.plib.storage import p_local_storage
+from pelit.plib import scrub as scrub_module
+from pelit.plib.checksum import save_with_checksum, read_checksum
+from pelit.plib.scrub import scrub, _walk
+
+def make_storage(tmp_path: Path) -> p_local_storage:
+    root = tmp_path / "data"
+    for directory, file in [("img", "a"), ("img", "b"), ("img", "c"),
+                            ("img-old", "a"), ("img-old", "b")]:
+        (root / directory).mkdir(parents=True, exist_ok=True)
+        save_with_checksum(io.BytesIO(file.encode()), root / directory / file)
+    return p_local_storage(str(root))
+
+def test_walk_order_matches_keys(tmp_path: Path):
+    keys = [key for key, _ in _walk(make_storage(tmp_path))]
+    assert keys == sorted(keys)
+
+def test_resume_after_prefix_directory(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    storage = make_storage(tmp_path)
+    state = tmp_path / "scrub.json"
+    monkeypatch.setattr(scrub_module, "_BATCH", 1)
+
+    # 检查两个文件后中断，此时 img 和 img-old 中只有一个处理过一部分
+    calls = 0
+    def interrupted(path: Path) -> str | None:
+        nonlocal calls
+        calls += 1
+        if calls > 2:
+            raise KeyboardInterrupt
+        return read_checksum(path)
+    monkeypatch.setattr(scrub_module, "read_checksum", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        scrub(storage, state, p_logger(0), jobs=1)
+    assert json.loads(state.read_text())["report"]["checked"] == 2
+
+    monkeypatch.setattr(scrub_module, "read_checksum", read_checksum)
+    report = scrub(storage, state, p_logger(0), jobs=1)
+
+    # 续传后每个文件都恰好检查一次
+    assert report["checked"] == 5
+    assert report["corrupt"] == [] and report["unexpected"] == []
+    assert not state.exists()
+
+def test_detects_corruption(tmp_path: Path):
+    storage = make_storage(tmp_path)
+    (storage.roots[0] / "img-old" / "a").write_bytes(b"changed")
+
+    report = scrub(storage, tmp_path / "scrub.json", p_logger(0), jobs=1)
+
+    assert report["checked"] == 5
+    assert [item["path"] for item in report["corrupt"]] == [str(storage.roots[0] / "img-old" / "a")]
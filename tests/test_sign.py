@@ -0,0 +1,59 @@
+import time
+import pytest
+from urllib.parse import parse_qsl
+from pelit.plib.sign import p_signer, key_id, create_signer
+
+OLD = "old-secret-at-least-16-chars"
+NEW = "new-secret-at-least-16-chars"
+
+def signed(signer: p_signer, directory: str, file: str, expires: int | None = None) -> dict[str, str]:
+    return dict(parse_qsl(signer.sign(directory, file, expires)))
+
+def test_sign_and_verify():
+    signer = p_signer([NEW])
+    args = signed(signer, "img", "a.png")
+    assert args["k"] == key_id(NEW)
+    assert signer.verify("img", "a.png", args)
+    # 签名绑定目录和文件名
+    assert not signer.verify("img", "b.png", args)
+    assert not signer.verify("doc", "a.png", args)
+
+def test_expired(monkeypatch: pytest.MonkeyPatch):
+    signer = p_signer([NEW], expires=60)
+    args = signed(signer, "img", "a.png")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert not signer.verify("img", "a.png", args)
+
+def test_unknown_key():
+    args = signed(p_signer([NEW]), "img", "a.png")
+    assert not p_signer([OLD]).verify("img", "a.png", args)
+    assert not p_signer([NEW]).verify("img", "a.png", args | {"k": "00000000"})
+
+def test_tampered_signature():
+    signer = p_signer([NEW])
+    args = signed(signer, "img", "a.png")
+    flipped = ("A" if args["s"][0] != "A" else "B") + args["s"][1:]
+    assert not signer.verify("img", "a.png", args | {"s": flipped})
+    assert not signer.verify("img", "a.png", args | {"s": ""})
+    assert not signer.verify("img", "a.png", args | {"e": str(int(args["e"]) + 1)})
+    assert not signer.verify("img", "a.png", args | {"e": "x"})
+    # 非 ASCII 的签名返回 False 而不是抛出异常
+    assert not signer.verify("img", "a.png", args | {"s": "é"})
+
+def test_rotation():
+    old_args = signed(p_signer([OLD]), "img", "a.png")
+    rotated = p_signer([NEW, OLD])
+    # 旧密钥签发的地址仍然有效，新地址用新密钥签名
+    assert rotated.verify("img", "a.png", old_args)
+    new_args = signed(rotated, "img", "a.png")
+    assert new_args["k"] == key_id(NEW)
+    assert rotated.verify("img", "a.png", new_args)
+    assert not p_signer([OLD]).verify("img", "a.png", new_args)
+
+def test_create_signer(monkeypatch: pytest.MonkeyPatch):
+    assert create_signer({}) is None
+    monkeypatch.setenv("PELIT_SIGN_KEYS", f"{NEW}, {OLD}")
+    signer = create_signer({"from_env": True})
+    assert signer is not None
+    assert signed(signer, "img", "a.png")["k"] == key_id(NEW)
@@ -0,0 +1,56 @@
+import pytest
+from pathlib import Path
+from pelit.plib.storage import p_storage, p_striped_storage, create_storage
+
+def make_roots(tmp_path: Path, n: int) -> list[str]:
+    roots = [tmp_path / f"d{i}" for i in range(n)]
+    for root in roots:
+        root.mkdir()
+    return [str(root) for root in roots]
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        p_storage()  # type: ignore[abstract]
+
+def test_striped_locate_is_deterministic(tmp_path: Path):
+    roots = make_roots(tmp_path, 3)
+    a = p_striped_storage(roots)
+    b = create_storage({"backend": "striped", "roots": roots})
+    names = [f"{i:04x}.png" for i in range(200)]
+    assert [a.locate("img", name) for name in names] == [b.locate("img", name) for name in names]
+    # 文件名足够多时每个根目录都会被用到
+    assert {a.locate("img", name).parents[1] for name in names} == {Path(root) for root in roots}
+
+def test_striped_allocate_matches_locate(tmp_path: Path):
+    storage = p_striped_storage(make_roots(tmp_path, 3))
+    for _ in range(50):
+        path = storage.allocate("img", ".png")
+        assert path.suffix == ".png"
+        assert not path.exists()
+        assert storage.locate("img", path.name) == path
+
+def test_striped_allocate_skips_unhealthy_roots(tmp_path: Path):
+    roots = make_roots(tmp_path, 2)
+    Path(roots[0]).rmdir()
+    storage = p_striped_storage(roots)
+    for _ in range(20):
+        assert storage.allocate("img", "").parents[1] == Path(roots[1])
+
+def test_list_dir_merges_roots(tmp_path: Path):
+    roots = make_roots(tmp_path, 2)
+    storage = p_striped_storage(roots)
+    (Path(roots[0]) / "img").mkdir()
+    (Path(roots[0]) / "img" / "b.png").write_bytes(b"b")
+    (Path(roots[0]) / "img" / ".b.png.sha256").write_text("0")
+    (Path(roots[1]) / "img").mkdir()
+    (Path(roots[1]) / "img" / "a.png").write_bytes(b"a")
+    (Path(roots[1]) / "img" / "b.png").write_bytes(b"b")
+    (Path(roots[1]) / "doc").mkdir()
+
+    assert storage.list_dir("img") == ["a.png", "b.png"]
+    assert storage.list_dir("") == ["doc", "img"]
+
+def test_list_dir_missing(tmp_path: Path):
+    storage = p_striped_storage(make_roots(tmp_path, 2))
+    with pytest.raises(FileNotFoundError):
+        storage.list_dir("img")
@@ -0,0 +1,20 @@
+import sys
+import subprocess
+from pathlib import Path
+
+def test_profile_flushed_on_exit(tmp_path: Path):
+    # 采样次数不足 dump_every，只有退出时才会写入
+    script = f"""
+import cProfile
+from pelit.plib.log import p_logger
+from pelit.plib.timing import p_profiler
+profiler = p_profiler({{"sample": 1, "dump_every": 100, "dir": {str(tmp_path)!r}}}, p_logger(0))
+p = cProfile.Profile()
+p.enable()
+sum(range(1000))
+p.disable()
+profiler._collect(p)
+"""
+    src = Path(__file__).parents[1] / "src"
+    subprocess.run([sys.executable, "-c", script], check=True, env={"PYTHONPATH": str(src)})
+    assert len(list(tmp_path.glob("pelit-*.prof"))) == 1